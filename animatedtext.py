@@ -1,121 +1,171 @@
-from PIL import Image, ImageDraw, ImageFont
-import cv2
+from PIL import Image
 import numpy as np
-from gtts import gTTS 
-import os
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, CompositeVideoClip
+from slides import render_text_frame
+from tts import default_tts
+from encoder import still_spans, write_clip, write_spans
+from transitions import faded_clip
+from timeline import TimelineCompositor
+from segments import StillSegment, default_segment_cache, render_segments
+from metrics import begin_render, span
+from preview import PREVIEW_FPS, PREVIEW_SCALE, preview_of
+from effects import caption_spans
 
 class SimpleVideoGenerator:
-    def __init__(self):
+    def __init__(self, slide_cache=None, tts=None, fast_still=True, segment_workers=None,
+                 incremental=False, segment_cache=None):
         self.width = 1280
         self.height = 720
+        self.fps = 24
+        self.scale = 1.0  # Fraction of width x height actually rendered (see preview)
+        self.encode_options = None  # Codec parameters (None = encoder defaults)
         self.background_color = (255, 255, 255)  # White
         self.text_color = (0, 0, 0)  # Black
+        self.slide_cache = slide_cache
+        self.tts = tts or default_tts()
+        self.fast_still = fast_still  # Encode still spans directly instead of per-frame clips
+        self.segment_workers = segment_workers  # Encode slides in parallel processes and join them
+        # Reuse the encoded slides that did not change since an earlier render
+        self.segment_cache = segment_cache or (default_segment_cache() if incremental else None)
         
     def create_text_image(self, text, font_size=60):
         """Create a PIL Image with text"""
-        # Create blank image
-        image = Image.new('RGB', (self.width, self.height), self.background_color)
-        draw = ImageDraw.Draw(image)
-        
-        # Try to use Arial font, fall back to default if not available
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-        
-        # Calculate text size and position
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        # Center the text
-        x = (self.width - text_width) // 2
-        y = (self.height - text_height) // 2
-        
-        # Draw text
-        draw.text((x, y), text, font=font, fill=self.text_color)
-        
-        return image
+        frame = render_text_frame(text, self.width, self.height, self.background_color,
+                                  font_size, self.text_color, cache=self.slide_cache, scale=self.scale)
+        return Image.fromarray(frame)
+    
+    def preview(self, scale=PREVIEW_SCALE, fps=PREVIEW_FPS):
+        """Return a copy of this generator that renders quick low-resolution previews"""
+        return preview_of(self, scale, fps)
     
     def create_video(self, text, duration=5, output_path="output.mp4"):
         """Create a simple video with text and speech"""
+        render = begin_render("animatedtext.video")
         try:
             # Create image with text
-            text_image = self.create_text_image(text)
+            with span("text_render"):
+                text_image = self.create_text_image(text)
             
-            # Convert PIL image to MoviePy clip
-            clip = ImageClip(np.array(text_image))
-            clip = clip.set_duration(duration)
+            if self.fast_still:
+                # Only the fade frames differ; the rest is one span piped to ffmpeg
+                with span("tts"):
+                    audio_path = self.tts.synthesize(text, lang='en')
+                with span("encode"):
+                    spans = still_spans(np.array(text_image), duration, self.fps, fade_in=1, fade_out=1)
+                    write_spans(spans, output_path, self.fps, audio_path=audio_path,
+                                options=self.encode_options)
+                print(f"Video created successfully: {output_path}")
+                return render.succeed(output_path)
             
-            # Add fade in/out effects
-            clip = clip.fadeout(1).fadein(1)
+            # Convert PIL image to MoviePy clip with precomputed fade in/out frames
+            with span("clip_build"):
+                clip = faded_clip(np.array(text_image), duration, self.fps, fade_in=1, fade_out=1)
             
             # Generate speech
-            temp_audio = "temp_audio.mp3"
-            tts = gTTS(text=text, lang='en')
-            tts.save(temp_audio)
-            
-            # Add audio
-            audio = AudioFileClip(temp_audio)
-            final_clip = clip.set_audio(audio)
+            with span("tts"):
+                audio_path = self.tts.synthesize(text, lang='en')
             
-            # Write video
-            final_clip.write_videofile(output_path, fps=24)
-            
-            # Clean up
-            os.remove(temp_audio)
+            # Write video, muxing the cached speech in directly
+            with span("encode"):
+                write_clip(clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                clip.close()
             
             print(f"Video created successfully: {output_path}")
-            return True
+            return render.succeed(output_path)
         
         except Exception as e:
             print(f"Error creating video: {str(e)}")
-            return False
+            return render.fail(e)
     
-    def create_multi_text_video(self, text_list, output_path="output.mp4"):
-        """Create a video with multiple text segments"""
+    def create_multi_text_video(self, text_list, output_path="output.mp4", crossfade=False):
+        """Create a video with multiple text segments, faded through black or crossfaded"""
+        render = begin_render("animatedtext.multi_text_video")
         try:
-            clips = []
+            segments = []
             duration_per_text = 3
+            previous = None
             
-            # Create clip for each text
+            # Describe a slide for each text
             for i, text in enumerate(text_list):
                 # Create image with text
-                text_image = self.create_text_image(text)
-                
-                # Convert to MoviePy clip
-                clip = ImageClip(np.array(text_image))
-                clip = clip.set_duration(duration_per_text)
-                clip = clip.set_start(i * duration_per_text)
-                clip = clip.fadeout(1).fadein(1)
+                with span("text_render"):
+                    frame = np.array(self.create_text_image(text))
                 
-                clips.append(clip)
-            
-            # Combine all clips
-            final_clip = CompositeVideoClip(clips)
+                last = i == len(text_list) - 1
+                segments.append(StillSegment(frame, duration_per_text, fade_in=1,
+                                             fade_out=0 if crossfade and not last else 1,
+                                             previous=previous if crossfade else None))
+                previous = frame
             
             # Generate speech
-            temp_audio = "temp_audio.mp3"
-            tts = gTTS(text=" ".join(text_list), lang='en')
-            tts.save(temp_audio)
+            with span("tts"):
+                audio_path = self.tts.synthesize(" ".join(text_list), lang='en')
+            
+            if self.segment_workers or self.segment_cache is not None:
+                # Encode each slide separately and join them without re-encoding
+                with span("encode"):
+                    render_segments(segments, output_path, self.fps, audio_path=audio_path,
+                                    options=self.encode_options, workers=self.segment_workers,
+                                    cache=self.segment_cache)
+                print(f"Video created successfully: {output_path}")
+                return render.succeed(output_path)
             
-            # Add audio
-            audio = AudioFileClip(temp_audio)
-            final_clip = final_clip.set_audio(audio)
+            # Convert to MoviePy clips with precomputed fades
+            with span("clip_build"):
+                clips = []
+                for i, segment in enumerate(segments):
+                    clip = faded_clip(segment.frame, segment.duration, self.fps, segment.fade_in,
+                                      segment.fade_out, segment.previous)
+                    clips.append(clip.set_start(i * duration_per_text))
             
-            # Write video
-            final_clip.write_videofile(output_path, fps=24)
+            # Combine all clips; only the slides active at each frame are composited
+            with span("composite"):
+                final_clip = TimelineCompositor(clips).clip()
             
-            # Clean up
-            os.remove(temp_audio)
+            # Write video, muxing the cached speech in directly
+            with span("encode"):
+                write_clip(final_clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                final_clip.close()
             
             print(f"Video created successfully: {output_path}")
-            return True
+            return render.succeed(output_path)
+            
+        except Exception as e:
+            print(f"Error creating video: {str(e)}")
+            return render.fail(e)
+    
+    def create_animated_text_video(self, text, effect="typewriter", output_path="output.mp4",
+                                   duration=None, spoken_color=(220, 30, 30)):
+        """Create a video whose text animates in time with its speech.
+
+        effect is "typewriter", "words", "karaoke" or "scroll" (see
+        effects.caption_spans). duration defaults to the length of the
+        speech plus one second.
+        """
+        render = begin_render("animatedtext.animated_text_video")
+        try:
+            with span("tts"):
+                audio_path = self.tts.synthesize(text, lang='en')
+            
+            # Text and background are laid out once; frames are built as the encoder reads them
+            with span("text_render"):
+                spans = caption_spans(text, effect, audio_path, self.width, self.height, self.fps,
+                                      self.background_color, self.text_color, spoken_color,
+                                      duration=duration, scale=self.scale)
             
+            with span("encode"):
+                write_spans(spans, output_path, self.fps, audio_path=audio_path,
+                            options=self.encode_options)
+            
+            print(f"Video created successfully: {output_path}")
+            return render.succeed(output_path)
+        
         except Exception as e:
             print(f"Error creating video: {str(e)}")
-            return False
+            return render.fail(e)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+import hashlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import wave
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+from diskcache import DiskStore, cache_root
+from encoder import ffmpeg_exe
+from metrics import registry
+
+SAMPLE_RATE = 44100
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a file, read in 1 MB blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def decode_audio(path: str, sample_rate: int = SAMPLE_RATE, channels: int = 2) -> np.ndarray:
+    """
+    Decode an audio file once into float32 samples.
+
+    Args:
+        path: Any audio (or video) file ffmpeg can read
+        sample_rate: Sample rate to resample to
+        channels: Number of channels to up- or downmix to
+
+    Returns:
+        Read-only Nxchannels float32 array in [-1, 1]
+    """
+    cmd = [ffmpeg_exe(), "-loglevel", "error", "-i", path, "-vn",
+           "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate), "-"]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}: "
+                           f"{result.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    """Clip float samples to [-1, 1] and convert them to 16-bit PCM."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def wav_bytes(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Encode float samples (N or NxC) as a 16-bit PCM WAV file."""
+    pcm = to_int16(samples)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1 if pcm.ndim == 1 else pcm.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def duck_gain(voice: np.ndarray, sample_rate: int = SAMPLE_RATE, amount_db: float = -12.0,
+              threshold_db: float = -40.0, attack: float = 0.05, release: float = 0.4,
+              block: float = 0.01) -> np.ndarray:
+    """
+    Per-sample gain that lowers music while the voice track is speaking.
+
+    The voice level is measured as RMS over short blocks; blocks above the
+    threshold pull the gain down to amount_db. The gain follows with the
+    attack and release time constants, one step per block, and is then
+    interpolated back to the sample rate.
+
+    Args:
+        voice: Nxchannels voice track, aligned with the music
+        sample_rate: Sample rate of the voice track
+        amount_db: Music gain while speech is present
+        threshold_db: Voice RMS level counted as speech
+        attack: Seconds to duck once speech starts
+        release: Seconds to recover once speech stops
+        block: Length of a level measurement block in seconds
+
+    Returns:
+        float32 array of N gains
+    """
+    size = max(1, int(block * sample_rate))
+    blocks = -(-len(voice) // size)
+    padded = np.zeros((blocks * size,) + voice.shape[1:], dtype=np.float32)
+    padded[:len(voice)] = voice
+    rms = np.sqrt(np.mean(padded.reshape(blocks, -1) ** 2, axis=1))
+    speaking = rms > 10 ** (threshold_db / 20)
+    targets = np.where(speaking, 10 ** (amount_db / 20), 1.0)
+
+    down = 1 - np.exp(-block / max(attack, 1e-6))
+    up = 1 - np.exp(-block / max(release, 1e-6))
+    gains = np.empty(blocks)
+    gain = 1.0
+    for i, target in enumerate(targets):
+        gain += (target - gain) * (down if target < gain else up)
+        gains[i] = gain
+    centers = (np.arange(blocks) + 0.5) * size
+    return np.interp(np.arange(len(voice)), centers, gains).astype(np.float32)
+
+
+def loop_chunks(samples: np.ndarray, length: int, crossfade: int = 0,
+                chunk: int = 1 << 16) -> Iterator[np.ndarray]:
+    """
+    Stream exactly `length` samples of a looped track.
+
+    The first pass plays up to the start of the seam; every further pass is
+    one precomputed unit (the crossfaded seam followed by the body), so only
+    a single source-sized buffer is ever held, however long the output is.
+
+    Args:
+        samples: Nxchannels source samples
+        length: Number of samples to emit
+        crossfade: Samples of overlap at each loop seam (at most half the source)
+        chunk: Maximum number of samples per yielded array
+
+    Yields:
+        Views of at most `chunk` samples, in order
+    """
+    if len(samples) == 0:
+        raise ValueError("Cannot loop an empty track")
+    crossfade = min(crossfade, len(samples) // 2)
+    first = samples[:len(samples) - crossfade]
+    unit = first
+    if crossfade:
+        ramp = np.linspace(0.0, 1.0, crossfade, endpoint=False, dtype=np.float32)[:, None]
+        seam = samples[-crossfade:] * (1 - ramp) + samples[:crossfade] * ramp
+        unit = np.concatenate([seam, samples[crossfade:len(samples) - crossfade]])
+
+    emitted = 0
+    source = first
+    while emitted < length:
+        for start in range(0, len(source), chunk):
+            if emitted >= length:
+                return
+            piece = source[start:start + min(chunk, length - emitted)]
+            emitted += len(piece)
+            yield piece
+        source = unit
+
+
+class AudioMixer:
+    def __init__(self, sample_rate: int = SAMPLE_RATE, channels: int = 2,
+                 cache_dir: Optional[str] = None, max_cache_bytes: int = 1 << 30):
+        """
+        Mix voice-overs and background music in numpy, caching the mixed tracks.
+
+        Every source is decoded once into a float32 buffer, placed by sample
+        offset and summed in one pass, so the cost follows the number of
+        samples rather than clips times chunks.
+
+        Args:
+            sample_rate: Sample rate of the mix
+            channels: Number of channels of the mix
+            cache_dir: Directory for mixed tracks (defaults to <cache root>/audio)
+            max_cache_bytes: Maximum total size of the mix cache
+        """
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.cache = DiskStore(cache_dir or os.path.join(cache_root(), "audio"), max_cache_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, duration: float, music_path: Optional[str], voice_paths: Sequence[str],
+            voice_offsets: Optional[Sequence[float]], music_volume: float,
+            duck_db: Optional[float]) -> str:
+        """Hash of the sources' contents and the mix parameters."""
+        payload = json.dumps([
+            self.sample_rate, self.channels, round(duration, 6),
+            file_digest(music_path) if music_path else None,
+            [file_digest(path) for path in voice_paths],
+            list(voice_offsets) if voice_offsets is not None else None,
+            music_volume, duck_db,
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def mix(self, duration: float, music_path: Optional[str] = None,
+            voice_paths: Sequence[str] = (), voice_offsets: Optional[Sequence[float]] = None,
+            music_volume: float = 1.0, duck_db: Optional[float] = None) -> np.ndarray:
+        """
+        Mix a track of exactly `duration` seconds.
+
+        Args:
+            duration: Length of the mix in seconds
+            music_path: Background music, played from the start (not looped)
+            voice_paths: Voice-over files
+            voice_offsets: Start time of each voice-over in seconds; by
+                default they play back to back from the start
+            music_volume: Linear gain applied to the music
+            duck_db: Duck the music by this many dB under speech (None = off)
+
+        Returns:
+            Nxchannels float32 samples, not yet clipped
+        """
+        length = int(round(duration * self.sample_rate))
+        decoded: Dict[str, np.ndarray] = {}
+
+        def load(path):
+            if path not in decoded:
+                decoded[path] = decode_audio(path, self.sample_rate, self.channels)
+            return decoded[path]
+
+        voice = np.zeros((length, self.channels), dtype=np.float32)
+        position = 0
+        for i, path in enumerate(voice_paths):
+            samples = load(path)
+            if voice_offsets is not None:
+                position = int(round(voice_offsets[i] * self.sample_rate))
+            end = min(position + len(samples), length)
+            if end > position:
+                voice[position:end] += samples[:end - position]
+            position += len(samples)
+
+        if music_path is None:
+            return voice
+        music = load(music_path)[:length]
+        gain = np.full(len(music), music_volume, dtype=np.float32)
+        if duck_db is not None:
+            gain *= duck_gain(voice[:len(music)], self.sample_rate, duck_db)
+        voice[:len(music)] += music * gain[:, None]
+        return voice
+
+    def mix_to_file(self, duration: float, music_path: Optional[str] = None,
+                    voice_paths: Sequence[str] = (), voice_offsets: Optional[Sequence[float]] = None,
+                    music_volume: float = 1.0, duck_db: Optional[float] = None) -> str:
+        """
+        Mix a track (see mix) and return the path of the cached WAV file.
+
+        Returns:
+            Path to a checked-out copy of the cached mix, which cache
+            eviction does not remove (see DiskStore.checkout)
+        """
+        voice_paths = list(voice_paths)
+        key = self.key(duration, music_path, voice_paths, voice_offsets, music_volume, duck_db)
+        path = self.cache.checkout(key, ".wav")
+        with self._lock:
+            if path is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if path is None:
+            samples = self.mix(duration, music_path, voice_paths, voice_offsets, music_volume, duck_db)
+            path = self.cache.put(key, wav_bytes(samples, self.sample_rate), ".wav", checkout=True)
+        return path
+
+    def loop_to_file(self, music_path: str, duration: float, gain_db: float = 0.0,
+                     crossfade: float = 0.0, extension: str = ".mp3") -> str:
+        """
+        Loop or trim music to exactly `duration` seconds, streaming it to the encoder.
+
+        The result is cached per (source content, duration, gain, crossfade).
+
+        Args:
+            music_path: Source music file
+            duration: Length of the output in seconds
+            gain_db: Gain applied to the music in dB
+            crossfade: Overlap at each loop seam in seconds
+            extension: Output format, chosen by ffmpeg from the extension
+
+        Returns:
+            Path to a checked-out copy of the cached track, which cache
+            eviction does not remove (see DiskStore.checkout)
+        """
+        payload = json.dumps(["loop", self.sample_rate, self.channels, file_digest(music_path),
+                              round(duration, 6), gain_db, crossfade])
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        path = self.cache.checkout(key, extension)
+        with self._lock:
+            if path is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if path is not None:
+            return path
+
+        samples = decode_audio(music_path, self.sample_rate, self.channels)
+        gain = np.float32(10 ** (gain_db / 20))
+        os.makedirs(self.cache.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache.directory, suffix=".tmp")
+        os.close(fd)
+        cmd = [ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "f32le", "-ar", str(self.sample_rate),
+               "-ac", str(self.channels), "-i", "-", "-f", extension.lstrip("."), tmp_path]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            length = int(round(duration * self.sample_rate))
+            for piece in loop_chunks(samples, length, int(round(crossfade * self.sample_rate))):
+                process.stdin.write((piece * gain).tobytes())
+            process.stdin.close()
+            error = process.stderr.read().decode("utf-8", "replace")
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed: {error.strip()}")
+            return self.cache.put_file(key, tmp_path, extension, checkout=True)
+        except BaseException:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_default_mixer = None
+
+
+def default_mixer() -> AudioMixer:
+    """Process-wide audio mixer."""
+    global _default_mixer
+    if _default_mixer is None:
+        _default_mixer = AudioMixer()
+        registry.register_cache("audio", _default_mixer.stats)
+    return _default_mixer
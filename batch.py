@@ -0,0 +1,246 @@
+"""
+Render video jobs from a JSONL file on a process pool.
+
+Each line is a job spec:
+
+    {"id": "intro", "generator": "multi-text",
+     "init": {"output_dir": "output/intro", "seed": 1},
+     "params": {"text_list": ["Welcome", "Thank you for watching"]}}
+
+`generator` is one of text, multi-text, image, combined or multimedia;
+`params` are passed to the generator method and `init` to the generator
+constructor. Usage:
+
+    python batch.py jobs.jsonl --workers 8
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, Optional, Tuple
+
+from metrics import RenderResult
+
+# generator name -> (module, class, method)
+GENERATORS = {
+    "text": ("integrated", "IntegratedVideoGenerator", "create_text_video"),
+    "multi-text": ("integrated", "IntegratedVideoGenerator", "create_multi_text_video"),
+    "image": ("integrated", "IntegratedVideoGenerator", "create_image_video"),
+    "combined": ("combined", "CombinedVideoGenerator", "create_combined_video"),
+    "multimedia": ("gan", "MultimediaProcessor", "create_multimedia_video"),
+}
+
+
+def read_jobs(path: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Stream job specs from a JSONL file ("-" for stdin).
+
+    Yields:
+        (line number, spec or None, parse error or None); blank lines are skipped
+    """
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                spec = json.loads(line)
+                if not isinstance(spec, dict):
+                    raise ValueError("job spec must be a JSON object")
+                yield number, spec, None
+            except ValueError as e:
+                yield number, None, str(e)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def validate_job(spec: dict) -> Optional[str]:
+    """
+    Check that a job spec names a known generator and that its init and
+    params fit the generator's constructor and method.
+
+    Returns:
+        Why the job can never run, or None if it is valid
+    """
+    if spec.get("generator") not in GENERATORS:
+        return (f"Unknown generator: {spec.get('generator')!r} "
+                f"(expected one of {', '.join(GENERATORS)})")
+    for field in ("init", "params"):
+        if not isinstance(spec.get(field, {}), dict):
+            return f"{field} must be a JSON object"
+    module_name, class_name, method_name = GENERATORS[spec["generator"]]
+    generator_class = getattr(importlib.import_module(module_name), class_name)
+    try:
+        inspect.signature(generator_class).bind(**spec.get("init", {}))
+    except TypeError as e:
+        return f"Invalid init for {class_name}: {e}"
+    try:
+        # The method is looked up on the class, so self is bound explicitly
+        inspect.signature(getattr(generator_class, method_name)).bind(None, **spec.get("params", {}))
+    except TypeError as e:
+        return f"Invalid params for {class_name}.{method_name}: {e}"
+    return None
+
+
+def run_job(spec: dict) -> Dict:
+    """
+    Render one job; never raises.
+
+    Returns:
+        Result record with id, generator, status ("ok" or "failed"), output,
+        seconds and error, plus per-stage timings and counters when the
+        generator returns a RenderResult
+    """
+    start = time.perf_counter()
+    result = {"id": spec.get("id"), "generator": spec.get("generator"),
+              "status": "failed", "output": None, "error": None}
+    try:
+        error = validate_job(spec)
+        if error:
+            raise ValueError(error)
+        module_name, class_name, method_name = GENERATORS[spec["generator"]]
+        generator_class = getattr(importlib.import_module(module_name), class_name)
+        generator = generator_class(**spec.get("init", {}))
+        output = getattr(generator, method_name)(**spec.get("params", {}))
+        if isinstance(output, RenderResult):
+            result["stages"] = output.to_dict()["stages"]
+            result["counters"] = output.counters
+        if not output:
+            result["error"] = getattr(output, "error", None) or "generator reported failure"
+        else:
+            result["status"] = "ok"
+            result["output"] = os.fspath(output) if isinstance(output, (str, os.PathLike)) else None
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _report(result: Dict):
+    status = "ok" if result["status"] == "ok" else "FAILED"
+    detail = result["output"] if result["status"] == "ok" else result["error"]
+    print(f"[{status}] {result['id']} ({result['generator']}, {result['seconds']:.2f}s) {detail}",
+          flush=True)
+
+
+def run_batch(path: str, workers: Optional[int] = None, results_path: Optional[str] = None) -> Dict:
+    """
+    Render every job in a JSONL file on a process pool.
+
+    Jobs are read lazily and at most one per worker is in flight, so files
+    of any size stream through and every job in flight is running. A failing
+    job only fails itself; jobs caught in a worker crash are retried once.
+
+    Args:
+        path: JSONL job file, or "-" for stdin
+        workers: Number of worker processes (defaults to the CPU count)
+        results_path: Optional JSONL file to write one result record per job to
+
+    Returns:
+        Summary with job counts, wall time and throughput
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    results = []
+    results_file = open(results_path, "w", encoding="utf-8") if results_path else None
+
+    def finish(result):
+        results.append(result)
+        _report(result)
+        if results_file:
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = {}  # future -> (spec, attempt)
+    try:
+        for number, spec, error in read_jobs(path):
+            if spec is None:
+                finish({"id": f"line {number}", "generator": None, "status": "failed",
+                        "output": None, "error": f"Invalid JSON: {error}", "seconds": 0.0})
+                continue
+            spec.setdefault("id", f"line {number}")
+            while len(pending) >= workers:
+                pool = _collect(pool, pending, workers, finish)
+            pending[pool.submit(run_job, spec)] = (spec, 1)
+        while pending:
+            pool = _collect(pool, pending, workers, finish)
+    finally:
+        pool.shutdown()
+        if results_file:
+            results_file.close()
+
+    wall = time.perf_counter() - started
+    ok = sum(1 for r in results if r["status"] == "ok")
+    busy = sum(r["seconds"] for r in results)
+    summary = {
+        "jobs": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "workers": workers,
+        "wall_seconds": round(wall, 3),
+        "jobs_per_minute": round(60 * len(results) / wall, 2) if wall > 0 else 0.0,
+        "utilization": round(busy / (wall * workers), 3) if wall > 0 else 0.0,
+    }
+    print(f"Rendered {ok}/{len(results)} jobs in {wall:.1f}s with {workers} workers "
+          f"({summary['jobs_per_minute']} jobs/min, {summary['utilization']:.0%} utilization, "
+          f"{summary['failed']} failed)")
+    return summary
+
+
+def _collect(pool, pending, workers, finish):
+    """
+    Wait for at least one job to finish.
+
+    A crashed worker breaks the whole pool and every job in flight with it.
+    Jobs that completed before the crash keep their results; the others
+    were running (there is at most one per worker), so they are retried
+    once on a fresh pool before being failed.
+    """
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    if not any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+        for future in done:
+            finish(future.result())
+            del pending[future]
+        return pool
+
+    # The pool is broken: every job in flight finishes now, with a result or the error
+    wait(pending)
+    retry = []
+    for future, (spec, attempt) in pending.items():
+        if not isinstance(future.exception(), BrokenProcessPool):
+            finish(future.result())
+        elif attempt < 2:
+            retry.append((spec, attempt + 1))
+        else:
+            finish({"id": spec["id"], "generator": spec.get("generator"), "status": "failed",
+                    "output": None, "error": "worker process died", "seconds": 0.0})
+    pending.clear()
+    pool.shutdown(wait=False)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    for spec, attempt in retry:
+        pending[pool.submit(run_job, spec)] = (spec, attempt)
+    return pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render video jobs from a JSONL file.")
+    parser.add_argument("jobs", help="JSONL file with one job spec per line, or - for stdin")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--results", default=None, help="write per-job results to this JSONL file")
+    args = parser.parse_args()
+    summary = run_batch(args.jobs, args.workers, args.results)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure cold-start import time of the generator modules.
+
+Each module is imported in a fresh interpreter several times; the median
+is reported. The run fails (exit code 1) if a module is slower than
+--max-seconds or if importing it loads a heavy backend that should only
+be loaded on first use. Usage:
+
+    python benchmarks/bench_import.py --repeat 5 --max-seconds 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["integrated", "combined", "animatedtext", "gan", "batch", "segments", "audio", "transcribe"]
+
+# Backends that must not be imported until a generator actually uses them
+HEAVY_MODULES = ["moviepy", "cv2", "gtts", "pydub", "speech_recognition"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Import a module in `repeat` fresh interpreters."""
+    times, heavy = [], set()
+    for _ in range(repeat):
+        code = PROBE.format(root=ROOT, module=module, heavy=HEAVY_MODULES)
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip()}")
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(probe["seconds"])
+        heavy.update(probe["heavy"])
+    return {"module": module, "median_seconds": round(statistics.median(times), 4),
+            "max_seconds": round(max(times), 4), "heavy_imports": sorted(heavy)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time.")
+    parser.add_argument("modules", nargs="*", default=MODULES, help="modules to import")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="fail if a module's median import time exceeds this")
+    parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results, failed = [], False
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        results.append(result)
+        problems = []
+        if args.max_seconds is not None and result["median_seconds"] > args.max_seconds:
+            problems.append(f"slower than {args.max_seconds}s")
+        if result["heavy_imports"]:
+            problems.append(f"loads {', '.join(result['heavy_imports'])} at import")
+        failed = failed or bool(problems)
+        print(f"{module:14s} {result['median_seconds'] * 1000:8.1f} ms"
+              + (f"  FAIL: {'; '.join(problems)}" if problems else ""))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Benchmark the render pipeline stage by stage and generator by generator.
+
+Runs offline: speech comes from the tone TTS backend and every cache lives
+in a fresh temporary directory, so runs are reproducible. Each stage is
+timed separately for every (slide count, resolution) pair:
+
+    rasterize   render the slide frames (cold slide cache)
+    fades       precompute fade frames (cold transition engine)
+    assemble    build the MoviePy clips of a multi-slide timeline
+    composite   composite a sample of timeline frames
+    mix         mix one voice-over per slide over background music
+    encode      encode the slides through the still-span encoder
+
+The generators (IntegratedVideoGenerator, CombinedVideoGenerator, both
+SimpleVideoGenerators and MultimediaProcessor) are timed end to end.
+Results are written as JSON; pass --compare to check them against a
+previous run. Usage:
+
+    python benchmarks/bench_render.py --slides 1 10 100 --resolutions 480p 720p \\
+        --output bench.json
+    python benchmarks/bench_render.py --compare bench.json --threshold 1.2
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESOLUTIONS = {"480p": (854, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+SLIDE_COUNTS = [1, 10, 100, 1000]
+STAGES = ["rasterize", "fades", "assemble", "composite", "mix", "encode"]
+GENERATORS = ["integrated", "combined", "animatedtext", "text-video", "multimedia"]
+
+FPS = 24
+SECONDS_PER_SLIDE = 3
+# Timeline frames composited per run; the cost of a frame does not depend on the timeline length
+COMPOSITE_SAMPLES = 48
+
+
+def slide_texts(count):
+    return [f"Benchmark slide {i + 1} of {count}" for i in range(count)]
+
+
+def timed(func, repeat):
+    """Best wall time of `repeat` runs of func(), which may return a dict of extra fields."""
+    best, extra = None, {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        extra = result if isinstance(result, dict) else {}
+        best = seconds if best is None else min(best, seconds)
+    return best, extra
+
+
+class Bench:
+    def __init__(self, workdir, repeat):
+        self.workdir = workdir
+        self.repeat = repeat
+
+    def frames(self, texts, size):
+        from slide_cache import SlideCache
+        from slides import render_text_frame
+
+        cache = SlideCache(use_disk=False)
+        return [render_text_frame(text, size[0], size[1], (255, 255, 255), cache=cache) for text in texts]
+
+    def stage(self, name, texts, size):
+        """Time one stage; inputs of the stage are prepared outside the timing."""
+        from transitions import TransitionEngine, faded_clip, faded_frames
+
+        if name == "rasterize":
+            return timed(lambda: self.frames(texts, size), self.repeat)
+
+        frames = self.frames(texts, size)
+        if name == "fades":
+            def run():
+                engine = TransitionEngine()
+                for frame in frames:
+                    faded_frames(frame, SECONDS_PER_SLIDE, FPS, 1, 1, engine=engine)
+            return timed(run, self.repeat)
+
+        def build():
+            return [faded_clip(frame, SECONDS_PER_SLIDE, FPS, 1, 1).set_start(i * SECONDS_PER_SLIDE)
+                    for i, frame in enumerate(frames)]
+
+        if name == "assemble":
+            return timed(build, self.repeat)
+
+        if name == "composite":
+            from timeline import TimelineCompositor
+
+            timeline = TimelineCompositor(build())
+            times = [timeline.duration * k / COMPOSITE_SAMPLES for k in range(COMPOSITE_SAMPLES)]
+
+            def run():
+                for t in times:
+                    timeline.frame(t)
+                return {"frames": COMPOSITE_SAMPLES}
+            return timed(run, self.repeat)
+
+        if name == "mix":
+            from audio import AudioMixer
+            from tts import TextToSpeech, ToneBackend
+
+            tts = TextToSpeech(ToneBackend(), cache_dir=os.path.join(self.workdir, "tts"))
+            voices = [tts.synthesize(text) for text in texts]
+            music = tts.synthesize("background music " * 8)
+            mixer = AudioMixer(cache_dir=os.path.join(self.workdir, "mix"))
+            duration = len(texts) * SECONDS_PER_SLIDE
+            return timed(lambda: mixer.mix(duration, music, voices, duck_db=-12), self.repeat)
+
+        if name == "encode":
+            from encoder import still_spans, write_spans
+
+            output = os.path.join(self.workdir, "encode.mp4")
+
+            def run():
+                spans = [span for frame in frames
+                         for span in still_spans(frame, SECONDS_PER_SLIDE, FPS, 1, 1)]
+                write_spans(spans, output, FPS)
+                return {"bytes": os.path.getsize(output)}
+            return timed(run, self.repeat)
+
+        raise ValueError(f"Unknown stage: {name}")
+
+    def generator(self, name, texts, size):
+        """Time one generator end to end; returns (seconds, extra)."""
+        out = os.path.join(self.workdir, name)
+        os.makedirs(out, exist_ok=True)
+        width, height = size
+        if name == "integrated":
+            from integrated import IntegratedVideoGenerator
+
+            generator = IntegratedVideoGenerator(width, height, output_dir=out, seed=0)
+            run = lambda: generator.create_multi_text_video(texts)
+        elif name == "combined":
+            from combined import CombinedVideoGenerator
+
+            generator = CombinedVideoGenerator(width, height, output_dir=out, seed=0)
+            run = lambda: generator.create_combined_video(texts)
+        elif name in ("animatedtext", "text-video"):
+            generator = importlib.import_module(name).SimpleVideoGenerator()
+            generator.width, generator.height = width, height
+            path = os.path.join(out, "output.mp4")
+            if name == "animatedtext":
+                run = lambda: generator.create_multi_text_video(texts, output_path=path)
+            else:
+                run = lambda: generator.create_video(" ".join(texts), output_path=path)
+        elif name == "multimedia":
+            from PIL import Image
+            from gan import MultimediaProcessor
+            from tts import ToneBackend
+
+            images = []
+            for i, frame in enumerate(self.frames(texts, size)):
+                images.append(os.path.join(out, f"slide{i}.png"))
+                Image.fromarray(frame).save(images[-1])
+            music = os.path.join(out, "music.wav")
+            with open(music, "wb") as f:
+                f.write(ToneBackend().synthesize("background music " * 8))
+            processor = MultimediaProcessor(out)
+            dialogue = {f"scene{i}": text for i, text in enumerate(texts)}
+            run = lambda: processor.create_multimedia_video(dialogue, images, music,
+                                                            frame_duration=SECONDS_PER_SLIDE)
+        else:
+            raise ValueError(f"Unknown generator: {name}")
+
+        def checked():
+            result = run()
+            if not result:
+                raise RuntimeError(f"{name} reported failure: {getattr(result, 'error', None)}")
+            return {"stages": result.to_dict()["stages"]}
+        return timed(checked, self.repeat)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print the ratio to a baseline run; returns True if nothing regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {tuple(r["id"]): r for r in json.load(f)["results"]}
+    ok = True
+    print(f"\nCompared with {baseline_path} (threshold {threshold:.2f}x):")
+    for result in results:
+        old = baseline.get(tuple(result["id"]))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > threshold:
+            flag, ok = "  REGRESSION", False
+        print(f"  {'/'.join(map(str, result['id'])):40s} {old['seconds']:9.3f}s -> "
+              f"{result['seconds']:9.3f}s  {ratio:5.2f}x{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline.")
+    parser.add_argument("--slides", type=int, nargs="+", default=SLIDE_COUNTS)
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--stages", nargs="*", default=STAGES, choices=STAGES)
+    parser.add_argument("--generators", nargs="*", default=GENERATORS, choices=GENERATORS)
+    parser.add_argument("--max-generator-slides", type=int, default=100,
+                        help="skip end-to-end generator runs above this slide count")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per measurement (best is kept)")
+    parser.add_argument("--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare with a previous JSON result file")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio counted as a regression by --compare")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="videogen-bench-")
+    # Offline and cold: tone speech, caches in the scratch directory
+    os.environ["VIDEOGEN_TTS_BACKEND"] = "tone"
+    os.environ["VIDEOGEN_CACHE_DIR"] = os.path.join(workdir, "cache")
+    bench = Bench(workdir, args.repeat)
+    # Import MoviePy up front so the first measurement does not include it
+    importlib.import_module("moviepy.editor")
+
+    results = []
+
+    def record(kind, name, slides, resolution, seconds, extra):
+        result = {"id": [kind, name, slides, resolution], "kind": kind, "name": name,
+                  "slides": slides, "resolution": resolution, "seconds": round(seconds, 4),
+                  "ms_per_slide": round(1000 * seconds / slides, 3)}
+        result.update(extra)
+        results.append(result)
+        print(f"{kind:9s} {name:12s} {slides:5d} slides {resolution:>5s} {seconds:9.3f}s "
+              f"({result['ms_per_slide']:.1f} ms/slide)", flush=True)
+
+    for resolution in args.resolutions:
+        size = RESOLUTIONS[resolution]
+        for slides in args.slides:
+            texts = slide_texts(slides)
+            for stage in args.stages:
+                seconds, extra = bench.stage(stage, texts, size)
+                record("stage", stage, slides, resolution, seconds, extra)
+            if slides > args.max_generator_slides:
+                continue
+            for name in args.generators:
+                seconds, extra = bench.generator(name, texts, size)
+                record("generator", name, slides, resolution, seconds, extra)
+
+    report = {"commit": git_commit(), "python": platform.python_version(),
+              "platform": platform.platform(), "cpus": os.cpu_count(),
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,131 @@
 import os
-import random
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-from gtts import gTTS
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, CompositeVideoClip, concatenate_videoclips
+from PIL import Image
+from lazy import lazy_import
+from slides import pick_background, render_text_frame
+from tts import default_tts
+from transitions import faded_clip
+from encoder import fit_to_frame, write_clip
+from segments import StillSegment, default_segment_cache, render_segments
+from metrics import begin_render, span
+from preview import PREVIEW_FPS, PREVIEW_SCALE, preview_of, scaled_size
+
+moviepy = lazy_import("moviepy.editor")
 
 class CombinedVideoGenerator:
-    def __init__(self, width=1280, height=720, output_dir="output"):
+    def __init__(self, width=1280, height=720, output_dir="output", seed=None, slide_cache=None,
+                 tts=None, segment_workers=None,
+                 incremental=False, segment_cache=None):
         self.width = width
         self.height = height
         self.output_dir = output_dir
+        self.image_dir = output_dir  # Where sample images are looked up (kept by previews)
+        self.seed = seed  # Makes background choices repeatable, so slides hit the cache
+        self.slide_cache = slide_cache
+        self.tts = tts or default_tts()
+        self.segment_workers = segment_workers  # Encode slides in parallel processes and join them
+        # Reuse the encoded slides that did not change since an earlier render
+        self.segment_cache = segment_cache or (default_segment_cache() if incremental else None)
+        self.fps = 24
+        self.scale = 1.0  # Fraction of width x height actually rendered (see preview)
+        self.encode_options = None  # Codec parameters (None = encoder defaults)
         os.makedirs(output_dir, exist_ok=True)
     
     def create_text_image(self, text, font_size=60):
         """Create an image with text and random background"""
         background_colors = ["white", "yellow", "pink"]
-        background_color = random.choice(background_colors)
+        background_color = pick_background(background_colors, text, self.seed)
         color_map = {
             "white": (255, 255, 255),
             "yellow": (255, 255, 0),
             "pink": (255, 192, 203)
         }
         
-        image = Image.new('RGB', (self.width, self.height), color_map[background_color])
-        draw = ImageDraw.Draw(image)
-        
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-        
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        x = (self.width - text_width) // 2
-        y = (self.height - text_height) // 2
-        
-        draw.text((x, y), text, fill='black', font=font)
-        return image
+        frame = render_text_frame(text, self.width, self.height, color_map[background_color],
+                                  font_size, 'black', cache=self.slide_cache, scale=self.scale)
+        return Image.fromarray(frame)
+    
+    def preview(self, scale=PREVIEW_SCALE, fps=PREVIEW_FPS):
+        """Return a copy of this generator that renders quick low-resolution previews"""
+        return preview_of(self, scale, fps)
+    
+    def create_sample_frame(self, index):
+        """Create a sample image in memory, or load and letterbox it if a sample image file already exists"""
+        img_path = os.path.join(self.image_dir, f"sample_image{index}.jpg")
+        if os.path.exists(img_path):
+            with Image.open(img_path) as image:
+                return fit_to_frame(image, *scaled_size(self.width, self.height, self.scale))
+        colors = [(255, 200, 200), (200, 255, 200)]
+        return render_text_frame(f"Sample Image {index}", self.width, self.height,
+                                 colors[index % 2], 60, 'black', cache=self.slide_cache,
+                                 scale=self.scale)
     
     def create_sample_image(self, index):
         """Create a sample image using PIL"""
-        img_path = os.path.join(self.output_dir, f"sample_image{index}.jpg")
+        img_path = os.path.join(self.image_dir, f"sample_image{index}.jpg")
         if not os.path.exists(img_path):
-            # Create image with colored background
-            colors = [(255, 200, 200), (200, 255, 200)]
-            image = Image.new('RGB', (self.width, self.height), colors[index % 2])
-            
-            # Add text to image
-            draw = ImageDraw.Draw(image)
-            try:
-                font = ImageFont.truetype("arial.ttf", 60)
-            except:
-                font = ImageFont.load_default()
-            
-            text = f"Sample Image {index}"
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            x = (self.width - text_width) // 2
-            y = (self.height - text_height) // 2
-            
-            draw.text((x, y), text, fill='black', font=font)
-            
-            # Save image
-            image.save(img_path)
+            Image.fromarray(self.create_sample_frame(index)).save(img_path)
         return img_path
     
     def create_combined_video(self, texts, image_count=2, output_filename="combined_video.mp4"):
         """Create a video with text slides and images"""
+        render = begin_render("combined.combined_video")
         try:
-            clips = []
             frame_duration = 2.0
             
             # Combine texts and prepare clips
             all_text = " ".join(texts)
             
-            # Prepare text and image clips
-            for i, text in enumerate(texts):
-                # Create text image
-                text_image = self.create_text_image(text)
-                text_img_path = os.path.join(self.output_dir, f"text_frame_{i}.png")
-                text_image.save(text_img_path)
-                
-                # Create text clip
-                text_clip = ImageClip(text_img_path).set_duration(frame_duration)
-                text_clip = text_clip.fadeout(1).fadein(1)
-                clips.append(text_clip)
-                os.remove(text_img_path)
-            
-            # Add image clips
-            for i in range(image_count):
-                image_path = self.create_sample_image(i)
-                image_clip = ImageClip(image_path).set_duration(frame_duration)
-                clips.append(image_clip)
+            # Create text images and sample images
+            with span("text_render"):
+                text_frames = [np.array(self.create_text_image(text)) for text in texts]
+                image_frames = [self.create_sample_frame(i) for i in range(image_count)]
             
             # Generate speech for entire text
-            temp_audio_path = os.path.join(self.output_dir, "combined_audio.mp3")
-            tts = gTTS(text=all_text, lang='en')
-            tts.save(temp_audio_path)
+            with span("tts"):
+                audio_path = self.tts.synthesize(all_text, lang='en')
+            output_path = os.path.join(self.output_dir, output_filename)
             
-            # Combine clips
-            final_clip = concatenate_videoclips(clips)
-            audio_clip = AudioFileClip(temp_audio_path)
-            final_clip = final_clip.set_audio(audio_clip)
+            if self.segment_workers or self.segment_cache is not None:
+                # Encode each slide separately and join them without re-encoding
+                segments = [StillSegment(frame, frame_duration, fade_in=1, fade_out=1)
+                            for frame in text_frames]
+                segments += [StillSegment(frame, frame_duration) for frame in image_frames]
+                with span("encode"):
+                    render_segments(segments, output_path, self.fps, audio_path=audio_path,
+                                    options=self.encode_options, workers=self.segment_workers,
+                                    cache=self.segment_cache)
+                print(f"Combined video created: {output_path}")
+                return render.succeed(output_path)
             
-            # Write video
-            output_path = os.path.join(self.output_dir, output_filename)
-            final_clip.write_videofile(output_path, fps=24)
+            with span("clip_build"):
+                clips = []
+                
+                # Create text clips with precomputed fades
+                for frame in text_frames:
+                    clips.append(faded_clip(frame, frame_duration, self.fps, fade_in=1, fade_out=1))
+                
+                # Add image clips
+                for frame in image_frames:
+                    clips.append(moviepy.ImageClip(frame).set_duration(frame_duration))
+            
+            # Combine clips
+            with span("composite"):
+                final_clip = moviepy.concatenate_videoclips(clips)
             
-            # Clean up
-            os.remove(temp_audio_path)
+            # Write video, muxing the cached speech in directly
+            with span("encode"):
+                write_clip(final_clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                final_clip.close()
             
             print(f"Combined video created: {output_path}")
-            return output_path
+            return render.succeed(output_path)
             
         except Exception as e:
             print(f"Error creating combined video: {str(e)}")
-            return None
+            return render.fail(e)
 
 def main():
     generator = CombinedVideoGenerator()
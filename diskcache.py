@@ -0,0 +1,291 @@
+import atexit
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from metrics import current_render
+
+# Subdirectory of a store holding checked-out entries, one directory per process
+CHECKOUT_DIR = ".checkout"
+
+# Eviction removes entries until the store is this fraction of max_bytes, so
+# the puts that follow do not each walk the directory again
+LOW_WATER = 0.9
+
+
+def cache_root() -> str:
+    """Root directory for persistent caches (VIDEOGEN_CACHE_DIR overrides the default)."""
+    return os.environ.get(
+        "VIDEOGEN_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "video-generation"),
+    )
+
+
+class DiskStore:
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        """
+        Size-bounded key/value store of files on disk.
+
+        Entries are written atomically (temp file + rename), so several
+        processes can share one directory. When the total size exceeds
+        max_bytes, the least recently used entries are removed until it is
+        below LOW_WATER * max_bytes. The total is kept as a running count,
+        walked from disk only on first use and on eviction (which also picks
+        up entries other processes added).
+
+        Args:
+            directory: Directory holding the entries
+            max_bytes: Maximum total size of all entries
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}  # checked-out name -> renders holding it
+        self._checkout_dir: Optional[str] = None
+        self._checkout_pid: Optional[int] = None
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        """Path of the entry for a hex key, fanned out by its first two characters."""
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get_path(self, key: str, suffix: str = "") -> Optional[str]:
+        """
+        Look up an entry.
+
+        Args:
+            key: Hex digest identifying the entry
+            suffix: File extension the entry was stored with
+
+        Returns:
+            Path to the entry, or None if it is not cached
+        """
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            return None
+        return path
+
+    def checkout(self, key: str, suffix: str = "") -> Optional[str]:
+        """
+        Look up an entry and return a private path to it that eviction cannot remove.
+
+        Use this instead of get_path when the file is handed to code that
+        opens it later (ffmpeg, MoviePy): an entry found by get_path can be
+        evicted by a put from any process sharing the store before it is
+        read. The entry is hard-linked (or copied) into a directory of this
+        process inside the store, which eviction skips.
+
+        The link is kept until the render traced on this thread (see
+        metrics.begin_render) finishes, or until the process exits if no
+        render is being traced; the directory is removed at exit.
+
+        Returns:
+            Path to the checked-out entry, or None if it is not cached
+        """
+        path = self.get_path(key, suffix)
+        if path is None:
+            return None
+        try:
+            return self._check_out(path, key + suffix)
+        except OSError:
+            return None  # Evicted between the lookup and the link
+
+    def _check_out(self, path: str, name: str) -> str:
+        with self._lock:
+            directory = self._checkout_directory()
+            target = os.path.join(directory, name)
+            if not (name in self._pins and os.path.exists(target)):
+                try:
+                    os.link(path, target)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    shutil.copyfile(path, target)
+            self._pins[name] = self._pins.get(name, 0) + 1
+        render = current_render()
+        if render is not None:
+            render.on_finish(lambda: self._release(name, directory))
+        return target
+
+    def _release(self, name: str, directory: str):
+        """Drop one pin of a checkout, removing the link once no render holds it."""
+        with self._lock:
+            if directory != self._checkout_dir or name not in self._pins:
+                return  # Made before a fork; the directory belongs to the parent
+            self._pins[name] -= 1
+            if self._pins[name] > 0:
+                return
+            del self._pins[name]
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    def _checkout_directory(self) -> str:
+        """This process's checkout directory, created on first use (and again after a fork)."""
+        if self._checkout_pid != os.getpid():
+            host = socket.gethostname()
+            root = os.path.join(self.directory, CHECKOUT_DIR)
+            self._checkout_dir = os.path.join(root, f"{host}-{os.getpid()}")
+            self._checkout_pid = os.getpid()
+            self._pins.clear()
+            os.makedirs(self._checkout_dir, exist_ok=True)
+            atexit.register(shutil.rmtree, self._checkout_dir, True)
+            # Directories left by processes of this host that died without cleaning up
+            for name in os.listdir(root):
+                owner, _, pid = name.rpartition("-")
+                if (owner == host and pid.isdigit() and int(pid) != os.getpid()
+                        and not _alive(int(pid))):
+                    shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        return self._checkout_dir
+
+    def get(self, key: str, suffix: str = "") -> Optional[bytes]:
+        """Read an entry's contents, or None if it is not cached."""
+        path = self.get_path(key, suffix)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: str, data: bytes, suffix: str = "", checkout: bool = False) -> str:
+        """
+        Store bytes under a key.
+
+        Args:
+            checkout: Return a checked-out path (see checkout), taken before
+                eviction can run
+
+        Returns:
+            Path to the stored (or checked-out) entry
+        """
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if checkout:
+                checked_out = self._check_out(tmp_path, key + suffix)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._added(len(data))
+        return checked_out if checkout else path
+
+    def put_file(self, key: str, src_path: str, suffix: str = "", checkout: bool = False) -> str:
+        """
+        Move an existing file into the store under a key.
+
+        Args:
+            checkout: Return a checked-out path (see checkout), taken before
+                eviction can run
+
+        Returns:
+            Path to the stored (or checked-out) entry
+        """
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(src_path)
+        try:
+            os.replace(src_path, path)
+        except OSError:
+            # Different filesystem: fall back to a copy
+            with open(src_path, "rb") as f:
+                result = self.put(key, f.read(), suffix, checkout)
+            os.remove(src_path)
+            return result
+        if checkout:
+            path = self._check_out(path, key + suffix)
+        self._added(size)
+        return path
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory and CHECKOUT_DIR in dirs:
+                dirs.remove(CHECKOUT_DIR)  # Checked-out links are not entries
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def size(self) -> int:
+        """Total size of all entries in bytes."""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            return self._size
+
+    def _added(self, nbytes: int):
+        total = self.size()
+        with self._lock:
+            self._size = total + nbytes
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the store is at its low-water mark."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * LOW_WATER)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._size = total
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process with this id exists on this host."""
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; ask for its exit code instead
+        import ctypes
+
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: it exists
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
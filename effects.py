@@ -0,0 +1,264 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from audio import decode_audio
+from encoder import FrameSpan
+from fonts import DEFAULT_FONT
+from preview import scaled_size
+from textlayout import block_height, fit_text, get_atlas, wrap_text
+from transcribe import speech_chunks
+
+EFFECTS = ("typewriter", "words", "karaoke", "scroll")
+
+# Sample rate speech is analysed at for timing
+TIMING_RATE = 16000
+
+
+def speech_times(audio_path: str, count: int, min_silence: float = 0.2) -> Tuple[np.ndarray, float]:
+    """
+    Spread `count` evenly spaced units (characters) over the speech in a voice-over.
+
+    Only voiced time counts: a unit that falls into a pause is shown when
+    speech resumes, so reveals follow the voice rather than the clock.
+
+    Args:
+        audio_path: Voice-over file
+        count: Number of units
+        min_silence: Shortest pause treated as a pause, in seconds
+
+    Returns:
+        (start time of each unit, length of the voice-over), in seconds
+    """
+    samples = decode_audio(audio_path, TIMING_RATE, channels=1)[:, 0]
+    chunks = speech_chunks(samples, TIMING_RATE, min_silence=min_silence, padding=0.0)
+    if not chunks:
+        chunks = [(0, len(samples))]
+    # Piecewise-linear map from cumulative speech time to wall time
+    spoken, wall, total = [], [], 0.0
+    for start, end in chunks:
+        spoken += [total, total + (end - start) / TIMING_RATE]
+        wall += [start / TIMING_RATE, end / TIMING_RATE]
+        total += (end - start) / TIMING_RATE
+    times = np.interp(np.arange(count) * total / max(count, 1), spoken, wall)
+    return times, len(samples) / TIMING_RATE
+
+
+class CaptionLayers:
+    def __init__(self, text: str, width: int, height: int, background, color,
+                 font_size: int = 60, font_family: str = DEFAULT_FONT, scale: float = 1.0,
+                 margin: float = 0.05, line_spacing: float = 1.15, fit: bool = True):
+        """
+        Pre-rendered layers of an animated caption.
+
+        The text is laid out once (as render_text_frame does) into an alpha
+        layer plus an index layer holding, per pixel, the position of the
+        character that covers it. Frames are then made by copying the
+        background layer and writing the covered pixels that should be
+        visible, with no drawing per frame.
+
+        Args:
+            text: Caption text
+            width: Frame width the layout is computed for
+            height: Frame height the layout is computed for
+            background: RGB background color
+            color: RGB text color
+            font_size: Largest font size in pixels
+            font_family: Font file name or path
+            scale: Fraction of width x height to render at (see preview.scaled_size)
+            margin: Margin on each side as a fraction of the frame size
+            line_spacing: Distance between lines as a multiple of the line height
+            fit: Shrink the font until the text fits the frame; without it the
+                text is only wrapped and may be taller than the frame (for scrolling)
+        """
+        max_width = width * (1 - 2 * margin)
+        if fit:
+            size, lines = fit_text(text, max_width, height * (1 - 2 * margin), font_size,
+                                   font_family, line_spacing=line_spacing)
+        else:
+            size, lines = font_size, wrap_text(text, get_atlas(font_size, font_family), max_width)
+        atlas = get_atlas(size, font_family)
+        pitch = atlas.line_height * line_spacing
+        text_height = block_height(len(lines), atlas, line_spacing)
+
+        self.width, self.height = scaled_size(width, height, scale)
+        factor = self.height / height
+        if factor != 1:
+            atlas = get_atlas(max(1, round(size * factor)), font_family)
+            pitch, text_height = pitch * factor, int(round(text_height * factor))
+        self.lines = lines
+        self.pitch = pitch
+        self.text_height = text_height
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:] = np.asarray(background, dtype=np.uint8)
+        self.color = np.asarray(color, dtype=np.uint16)
+
+        # Text layers cover the whole text block, with room for overhanging glyphs
+        rows = max(text_height + atlas.line_height, self.height)
+        self.alpha = np.zeros((rows, self.width), dtype=np.uint8)
+        self.index = np.full((rows, self.width), -1, dtype=np.int32)
+        self.line_starts: List[int] = []
+        first = 0
+        for i, line in enumerate(lines):
+            self.line_starts.append(first)
+            atlas.blit(self.alpha, line, (self.width - atlas.width(line)) / 2,
+                       int(round(i * pitch)), self.index, first)
+            first += len(line) + 1  # The break counts as one character
+        self.characters = max(first - 1, 0)
+        # Top of the text block when it is centered in the frame
+        self.top = (self.height - text_height) // 2
+
+    def word_starts(self) -> np.ndarray:
+        """For each character, the position of the first character of its word."""
+        text = " ".join(self.lines)
+        starts = np.arange(len(text))
+        start = 0
+        for k, char in enumerate(text):
+            if char == " ":
+                start = k + 1
+            starts[k] = start
+        return starts
+
+    def _covered(self, top: int):
+        """Flat frame positions, alpha and character of every text pixel inside the frame."""
+        rows = slice(max(0, -top), min(self.alpha.shape[0], self.height - top))
+        ys, xs = np.nonzero(self.alpha[rows])
+        ys = ys + rows.start
+        positions = (ys + top) * self.width + xs
+        return positions, self.alpha[ys, xs], self.index[ys, xs]
+
+    def _blend(self, positions, alpha, color) -> np.ndarray:
+        """Text pixels in `color` over the background."""
+        a = alpha[:, None].astype(np.uint16)
+        pixels = self.background.reshape(-1, 3)[positions].astype(np.uint16)
+        return ((pixels * (255 - a) + color * a + 127) // 255).astype(np.uint8)
+
+    def reveal_spans(self, reveal_times: np.ndarray, duration: float, fps: int,
+                     color=None, base_color=None) -> List[FrameSpan]:
+        """
+        Frames of a caption whose characters appear at given times.
+
+        Covered pixels are sorted by the reveal time of their character once;
+        the frame at time t is the background plus the prefix of pixels
+        revealed by t, so building a frame is one copy and one scatter.
+        Consecutive identical frames become one span.
+
+        Args:
+            reveal_times: Time each character appears, in seconds
+            duration: Length of the caption in seconds
+            fps: Frames per second
+            color: RGB color of revealed text (defaults to the layers' color)
+            base_color: Show unrevealed text in this color instead of hiding it
+                (karaoke)
+
+        Returns:
+            Frame spans; pixels are built when the encoder reaches them
+        """
+        positions, alpha, index = self._covered(self.top)
+        reveal_times = np.asarray(reveal_times, dtype=np.float64)
+        times = reveal_times[index] if len(reveal_times) else np.zeros(len(index))
+        order = np.argsort(times, kind="stable")
+        positions, times = positions[order], times[order]
+        color = self.color if color is None else np.asarray(color, dtype=np.uint16)
+        inked = self._blend(positions, alpha[order], color)
+        base = self.background
+        if base_color is not None:
+            base = self.background.copy()
+            base.reshape(-1, 3)[positions] = self._blend(positions, alpha[order],
+                                                         np.asarray(base_color, dtype=np.uint16))
+
+        def frame(count):
+            image = base.copy()
+            image.reshape(-1, 3)[positions[:count]] = inked[:count]
+            return image
+
+        frame_times = np.arange(int(round(duration * fps))) / fps
+        counts = np.searchsorted(times, frame_times, side="right")
+        return _spans(counts, frame)
+
+    def scroll_spans(self, line_times: Sequence[float], duration: float, fps: int) -> List[FrameSpan]:
+        """
+        Frames of the whole text scrolling so the line being spoken stays centered.
+
+        Args:
+            line_times: Time each line starts being spoken, in seconds
+            duration: Length of the caption in seconds
+            fps: Frames per second
+
+        Returns:
+            Frame spans; pixels are built when the encoder reaches them
+        """
+        ys, xs = np.nonzero(self.alpha)  # Row-major, so sorted by row
+        alpha = self.alpha[ys, xs]
+        centers = np.arange(len(self.lines)) * self.pitch + self.pitch / 2
+        frame_times = np.arange(int(round(duration * fps))) / fps
+        # Frame row of the text block's top: the current line's center at the frame center
+        tops = np.round(self.height / 2 - np.interp(frame_times, line_times, centers)).astype(int)
+
+        def frame(top):
+            start, end = np.searchsorted(ys, [-top, self.height - top])
+            positions = (ys[start:end] + top) * self.width + xs[start:end]
+            image = self.background.copy()
+            image.reshape(-1, 3)[positions] = self._blend(positions, alpha[start:end], self.color)
+            return image
+
+        return _spans(tops, frame)
+
+
+def _spans(keys: np.ndarray, frame) -> List[FrameSpan]:
+    """One span per run of equal keys, its frame built lazily as frame(key)."""
+    spans = []
+    if len(keys) == 0:
+        return spans
+    breaks = np.flatnonzero(np.diff(keys)) + 1
+    for start, end in zip(np.concatenate([[0], breaks]), np.concatenate([breaks, [len(keys)]])):
+        key = keys[start].item()
+        spans.append(FrameSpan(lambda key=key: frame(key), int(end - start)))
+    return spans
+
+
+def caption_spans(text: str, effect: str, audio_path: str, width: int, height: int, fps: int,
+                  background, color, spoken_color=(220, 30, 30), duration: Optional[float] = None,
+                  hold: float = 1.0, font_size: int = 60, font_family: str = DEFAULT_FONT,
+                  scale: float = 1.0) -> List[FrameSpan]:
+    """
+    Frame spans of an animated caption timed to a voice-over.
+
+    Args:
+        text: Caption text
+        effect: "typewriter" (character by character), "words" (word by
+            word), "karaoke" (the whole text, words highlighted as spoken)
+            or "scroll" (the spoken line kept centered)
+        audio_path: Voice-over the effect follows
+        width: Frame width the layout is computed for
+        height: Frame height the layout is computed for
+        fps: Frames per second
+        background: RGB background color
+        color: RGB text color
+        spoken_color: RGB color karaoke switches spoken words to
+        duration: Length of the caption in seconds (defaults to the
+            voice-over plus `hold`)
+        hold: Time the finished caption stays on screen after the voice-over
+        font_size: Largest font size in pixels
+        font_family: Font file name or path
+        scale: Fraction of width x height to render at
+
+    Returns:
+        Frame spans for write_spans; pixels are built when the encoder reaches them
+    """
+    if effect not in EFFECTS:
+        raise ValueError(f"Unknown effect: {effect!r} (expected one of {', '.join(EFFECTS)})")
+    layers = CaptionLayers(text, width, height, background, color, font_size, font_family,
+                           scale, fit=effect != "scroll")
+    times, speech = speech_times(audio_path, layers.characters)
+    if duration is None:
+        duration = speech + hold
+    if effect == "scroll":
+        starts = np.minimum(layers.line_starts, len(times) - 1)
+        line_times = times[starts] if len(times) else np.zeros(len(starts))
+        return layers.scroll_spans(line_times, duration, fps)
+    if effect in ("words", "karaoke"):
+        times = times[layers.word_starts()]
+    if effect == "karaoke":
+        return layers.reveal_spans(times, duration, fps, spoken_color, base_color=color)
+    return layers.reveal_spans(times, duration, fps)
@@ -0,0 +1,347 @@
+import os
+import subprocess
+import tempfile
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from metrics import count
+from transitions import faded_frames
+
+
+def ffmpeg_exe() -> str:
+    """Path to the ffmpeg binary (the one bundled with imageio-ffmpeg if available)."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return "ffmpeg"
+
+
+class EncodeOptions:
+    def __init__(self, codec: str = "libx264", preset: str = "medium", crf: Optional[int] = None,
+                 pix_fmt: str = "yuv420p", audio_codec: str = "aac", audio_bitrate: str = "128k",
+                 threads: Optional[int] = None):
+        """
+        Codec parameters shared by every encode of one render.
+
+        Segments encoded with the same options can be joined without re-encoding.
+        """
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.pix_fmt = pix_fmt
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.threads = threads
+
+    def video_args(self) -> List[str]:
+        args = ["-c:v", self.codec, "-pix_fmt", self.pix_fmt]
+        if self.codec == "libx264":
+            args += ["-preset", self.preset]
+            if self.crf is not None:
+                args += ["-crf", str(self.crf)]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+    def audio_args(self) -> List[str]:
+        return ["-c:a", self.audio_codec, "-b:a", self.audio_bitrate]
+
+
+# Longest setpts expression used before falling back to CFR (ffmpeg evaluates all
+# of it for every frame); it is passed in a filter script, not on the command line
+MAX_VFR_EXPRESSION = 100_000
+
+
+class FrameSpan:
+    def __init__(self, frame, count: int):
+        """
+        A run of `count` identical frames.
+
+        Args:
+            frame: HxWx3 uint8 array, or a callable returning one so that
+                spans can be listed before their pixels are loaded
+            count: Number of frames
+        """
+        self.frame = frame
+        self.count = count
+
+    def pixels(self) -> np.ndarray:
+        """The frame as a contiguous uint8 array, loading it if needed."""
+        frame = self.frame() if callable(self.frame) else self.frame
+        return np.ascontiguousarray(frame, dtype=np.uint8)
+
+
+def still_spans(frame: np.ndarray, duration: float, fps: int, fade_in: float = 0.0,
+                fade_out: float = 0.0, previous: Optional[np.ndarray] = None) -> List[FrameSpan]:
+    """
+    Describe a still image shown for `duration` seconds as spans of identical frames.
+
+    Fades go to black, matching MoviePy's fadein/fadeout, or crossfade in
+    from `previous`. Only the frames inside the fade windows are computed
+    (in one batched pass by the transition engine); everything in between
+    is a single span.
+
+    Args:
+        frame: HxWx3 uint8 image
+        duration: Duration in seconds
+        fps: Frames per second
+        fade_in: Fade-in duration in seconds
+        fade_out: Fade-out duration in seconds
+        previous: Frame to crossfade in from instead of black
+
+    Returns:
+        List of spans covering round(duration * fps) frames
+    """
+    factors, faded = faded_frames(frame, duration, fps, fade_in, fade_out, previous)
+    spans = []
+    k = 0
+    i = 0
+    while i < len(factors):
+        if factors[i] < 1:
+            spans.append(FrameSpan(faded[k], 1))
+            k += 1
+            i += 1
+            continue
+        j = i + 1
+        while j < len(factors) and factors[j] == 1:
+            j += 1
+        spans.append(FrameSpan(frame, j - i))
+        i = j
+    return spans
+
+
+def fit_to_frame(image: Image.Image, width: int, height: int, color=(0, 0, 0)) -> np.ndarray:
+    """Scale an image to fit inside width x height and letterbox it onto a solid background."""
+    image = image.convert("RGB")
+    if image.size != (width, height):
+        scale = min(width / image.width, height / image.height)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        resized = image.resize(size, Image.BILINEAR)
+        image = Image.new("RGB", (width, height), color)
+        image.paste(resized, ((width - size[0]) // 2, (height - size[1]) // 2))
+    return np.asarray(image)
+
+
+def _setpts_expression(spans: List[FrameSpan]) -> str:
+    """
+    Map the index N of each distinct frame sent to ffmpeg to its output frame index.
+
+    One frame is sent per span, plus a repeat of the last frame on the
+    final frame index when the last span is longer than one frame, so the
+    video ends exactly at the last span's end and segments can be joined
+    back to back.
+    """
+    points = []
+    position = 0
+    for span in spans:
+        points.append(position)
+        position += span.count
+    if spans[-1].count > 1:
+        points.append(position - 1)
+    if len(points) == 1:
+        return "0"
+    return "+".join(f"gte(N,{k})*{points[k] - points[k - 1]}" for k in range(1, len(points)))
+
+
+def write_spans(spans: Iterable[FrameSpan], output_path: str, fps: int,
+                audio_path: Optional[str] = None, options: Optional[EncodeOptions] = None,
+                vfr: bool = True) -> str:
+    """
+    Encode spans of identical frames by piping raw frames to ffmpeg.
+
+    With vfr (the default) each distinct frame is sent and encoded once and
+    held on screen for its span through variable frame rate timestamps, so
+    a still costs the same however long it is shown. Otherwise the same
+    buffer is written for every repeat, which still avoids per-frame
+    Python work but makes the encoder process every frame.
+
+    Args:
+        spans: Frame spans; all frames must share one size
+        output_path: Path of the video to write
+        fps: Frames per second
+        audio_path: Optional audio file to mux in, trimmed to the video length
+        options: Codec parameters
+        vfr: Encode each span as a single frame
+
+    Returns:
+        output_path
+    """
+    options = options or EncodeOptions()
+    spans = [span for span in spans if span.count > 0]
+    if not spans:
+        raise ValueError("No frames to encode")
+    expression = _setpts_expression(spans) if vfr else None
+    if expression is not None and len(expression) > MAX_VFR_EXPRESSION:
+        expression = None
+
+    first = spans[0].pixels()
+    height, width = first.shape[:2]
+
+    def chunks():
+        data = None
+        for i, span in enumerate(spans):
+            frame = first if i == 0 else span.pixels()
+            _check_size(frame, width, height)
+            data = frame.tobytes()
+            repeats = 1 if expression is not None else span.count
+            for _ in range(repeats):
+                yield data
+        if expression is not None and spans[-1].count > 1:
+            yield data
+
+    video_args = []
+    script_path = None
+    if expression is not None:
+        # The expression grows with the number of spans, past what a Windows
+        # command line (32,767 characters) holds, so ffmpeg reads it from a file
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as script:
+            script.write(f"setpts='({expression})/(FRAME_RATE*TB)'")
+        script_path = script.name
+        # B-frames would break the stored durations of long-held frames, and a
+        # track timescale of one tick per frame gives the last frame its duration
+        video_args = ["-filter_script:v", script_path, "-fps_mode", "vfr",
+                      "-video_track_timescale", str(fps), "-bf", "0"]
+    frames = sum(span.count for span in spans)
+    try:
+        _encode(chunks(), width, height, fps, output_path, frames / fps, audio_path, options,
+                video_args)
+    finally:
+        if script_path is not None:
+            os.remove(script_path)
+    count("frames_encoded", frames)
+    return output_path
+
+
+def write_clip(clip, output_path: str, fps: int, audio_path: Optional[str] = None,
+               options: Optional[EncodeOptions] = None) -> str:
+    """
+    Encode a MoviePy clip by streaming its frames straight to ffmpeg.
+
+    Replaces write_videofile: the audio file is muxed in directly instead of
+    being decoded and re-written to a temporary file next to the output, and
+    a frame returned again as the same array object (a still, or a cached
+    transition frame) is not converted to bytes again.
+
+    Args:
+        clip: MoviePy video clip with a duration
+        output_path: Path of the video to write
+        fps: Frames per second
+        audio_path: Optional audio file to mux in, trimmed to the clip duration
+        options: Codec parameters
+
+    Returns:
+        output_path
+    """
+    options = options or EncodeOptions()
+    width, height = clip.size
+
+    times = np.arange(0, clip.duration, 1.0 / fps)
+
+    def chunks():
+        previous, data = None, None
+        for t in times:
+            frame = clip.get_frame(t)
+            if frame is not previous:
+                _check_size(frame, width, height)
+                data = np.ascontiguousarray(frame, dtype=np.uint8).tobytes()
+                previous = frame
+            yield data
+
+    _encode(chunks(), width, height, fps, output_path, clip.duration, audio_path, options)
+    count("frames_encoded", len(times))
+    return output_path
+
+
+# ffmpeg errors of a stream copy into a container that does not support the codec
+_STREAM_COPY_ERRORS = (
+    "Could not write header",
+    "not currently supported in container",
+    "Could not find tag for codec",
+    "incompatible with output codec",
+    "Unsupported codec",
+)
+
+
+def mux_audio(video_path: str, output_path: str, audio: Union[str, np.ndarray],
+              duration: Optional[float] = None, sample_rate: int = 44100,
+              options: Optional[EncodeOptions] = None) -> str:
+    """
+    Attach an audio track to an encoded video without touching the video stream.
+
+    The video packets are copied as they are; the video is only re-encoded
+    if ffmpeg cannot store its codec in the output container. Other
+    failures, e.g. a missing or unreadable audio file, raise at once.
+
+    Args:
+        video_path: Encoded video; any audio it has is replaced
+        output_path: Path of the video to write (must differ from video_path)
+        audio: Audio file path, or an NxC int16 sample array
+        duration: Trim the audio to this many seconds (usually the video duration)
+        sample_rate: Sample rate of an audio array
+        options: Codec parameters for the audio and for a re-encode
+
+    Returns:
+        output_path
+    """
+    options = options or EncodeOptions()
+    trim = ["-t", f"{duration:.3f}"] if duration else []
+    if isinstance(audio, str):
+        audio_input, data = trim + ["-i", audio], None
+    else:
+        samples = np.ascontiguousarray(audio, dtype=np.int16)
+        channels = samples.shape[1] if samples.ndim > 1 else 1
+        audio_input = ["-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels)] + trim + ["-i", "-"]
+        data = samples.tobytes()
+
+    for video_args in (["-c:v", "copy"], options.video_args()):
+        cmd = ([ffmpeg_exe(), "-y", "-loglevel", "error", "-i", video_path] + audio_input
+               + ["-map", "0:v:0", "-map", "1:a:0"] + video_args + options.audio_args() + [output_path])
+        result = subprocess.run(cmd, input=data, capture_output=True)
+        if result.returncode == 0:
+            return output_path
+        error = result.stderr.decode("utf-8", "replace").strip()
+        # Only a container that cannot hold the copied stream is fixed by re-encoding;
+        # anything else (a missing or corrupt input, a full disk) would fail again
+        if not any(marker in error for marker in _STREAM_COPY_ERRORS):
+            break
+    raise RuntimeError(f"ffmpeg failed: {error}")
+
+
+def _check_size(frame: np.ndarray, width: int, height: int):
+    if frame.shape[:2] != (height, width):
+        raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} "
+                         f"does not match {width}x{height}")
+
+
+def _encode(chunks: Iterable[bytes], width: int, height: int, fps: int, output_path: str,
+            duration: float, audio_path: Optional[str], options: EncodeOptions,
+            video_args: Optional[List[str]] = None):
+    """Run ffmpeg on raw RGB frames from stdin, muxing in an optional audio file."""
+    cmd = [ffmpeg_exe(), "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}",
+           "-pix_fmt", "rgb24", "-r", str(fps), "-i", "-"]
+    if audio_path:
+        cmd += ["-t", f"{duration:.3f}", "-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    cmd += video_args or []
+    cmd += options.video_args()
+    if audio_path:
+        cmd += options.audio_args()
+    cmd.append(output_path)
+
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for data in chunks:
+            process.stdin.write(data)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    error = process.stderr.read().decode("utf-8", "replace")
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed: {error.strip()}")
@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import ImageFont
+
+DEFAULT_FONT = "arial.ttf"
+
+
+def _default_search_dirs():
+    """Directories probed for font files, in priority order."""
+    dirs = []
+    extra = os.environ.get("VIDEOGEN_FONT_PATH")
+    if extra:
+        dirs.extend(extra.split(os.pathsep))
+    if sys.platform.startswith("win"):
+        dirs.append(os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"))
+    elif sys.platform == "darwin":
+        dirs.extend([
+            "/Library/Fonts",
+            "/System/Library/Fonts",
+            os.path.expanduser("~/Library/Fonts"),
+        ])
+    else:
+        data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share")
+        dirs.extend(os.path.join(d, "fonts") for d in data_dirs.split(":") if d)
+        dirs.extend([
+            os.path.expanduser("~/.fonts"),
+            os.path.expanduser("~/.local/share/fonts"),
+        ])
+    return dirs
+
+
+class FontRegistry:
+    def __init__(self, max_fonts: int = 64, search_dirs=None):
+        """
+        Resolve and cache fonts for the slide renderers.
+
+        Args:
+            max_fonts: Maximum number of loaded (family, size) fonts kept in memory
+            search_dirs: Directories to probe for font files; defaults to the
+                platform font directories plus VIDEOGEN_FONT_PATH
+        """
+        self.max_fonts = max_fonts
+        self.search_dirs = list(search_dirs) if search_dirs is not None else _default_search_dirs()
+        self.hits = 0
+        self.misses = 0
+        self._fonts = OrderedDict()
+        self._paths: Dict[str, Optional[str]] = {}
+        self._failed = set()
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _build_index(self) -> Dict[str, str]:
+        """Walk the search directories once and map lower-cased file names to paths."""
+        index = {}
+        for directory in self.search_dirs:
+            if not os.path.isdir(directory):
+                continue
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    index.setdefault(name.lower(), os.path.join(root, name))
+        return index
+
+    def resolve(self, family: str = DEFAULT_FONT) -> Optional[str]:
+        """
+        Resolve a font family or file name to a path on disk.
+
+        Successful and failed lookups are both remembered, so each family is
+        probed at most once per process.
+
+        Args:
+            family: Font file name (e.g. "arial.ttf") or path
+
+        Returns:
+            Path to the font file, or None if it cannot be found
+        """
+        with self._lock:
+            if family in self._paths:
+                return self._paths[family]
+            if os.path.isfile(family):
+                path = family
+            else:
+                if self._index is None:
+                    self._index = self._build_index()
+                path = self._index.get(os.path.basename(family).lower())
+            self._paths[family] = path
+            return path
+
+    def _load(self, family: str, size: int):
+        path = self.resolve(family)
+        if path is not None and family not in self._failed:
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                self._failed.add(family)
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            # Pillow < 10.1 only ships the fixed-size bitmap font
+            return ImageFont.load_default()
+
+    def get(self, size: int, family: str = DEFAULT_FONT):
+        """
+        Get a loaded font, falling back to PIL's default font if unavailable.
+
+        Args:
+            size: Font size in pixels
+            family: Font file name or path
+
+        Returns:
+            PIL font object
+        """
+        key: Tuple[str, int] = (family, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return font
+            self.misses += 1
+        font = self._load(family, size)
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def is_available(self, family: str = DEFAULT_FONT) -> bool:
+        """Check whether a family resolves to a loadable font file."""
+        return self.resolve(family) is not None and family not in self._failed
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "loaded": len(self._fonts),
+                "failed": sum(1 for p in self._paths.values() if p is None) + len(self._failed),
+            }
+
+    def clear(self):
+        """Drop all loaded fonts, resolved paths and counters."""
+        with self._lock:
+            self._fonts.clear()
+            self._paths.clear()
+            self._failed.clear()
+            self._index = None
+            self.hits = 0
+            self.misses = 0
+
+
+registry = FontRegistry()
+
+
+def get_font(size: int, family: str = DEFAULT_FONT):
+    """Get a font from the process-wide registry."""
+    return registry.get(size, family)
@@ -1,147 +1,204 @@
 import os
-from PIL import Image
-import numpy as np
-import cv2
-from moviepy.editor import (
-    VideoFileClip, 
-    AudioFileClip, 
-    ImageClip, 
-    concatenate_videoclips,
-    CompositeAudioClip  # Added this import
-)
-from gtts import gTTS
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterator, Tuple, Optional
+import importlib.util
+import shutil
 import subprocess
 import sys
+from lazy import lazy_import
+from metrics import RenderResult, begin_render, span
+from parallel import map_ordered
+from tts import TextToSpeech, default_tts
+from encoder import EncodeOptions, mux_audio
+from preview import PREVIEW_FPS, PREVIEW_SCALE, preview_of
+from sequence import ImageSequence
+from motion import MotionSlideshow
+from audio import AudioMixer, default_mixer
+from transcribe import Recognizer, TranscriptSegment, transcribe_stream
 
-def check_dependencies():
-    """Check and install required dependencies."""
+moviepy = lazy_import("moviepy.editor")
+ffmpeg_reader = lazy_import("moviepy.video.io.ffmpeg_reader")
+
+def check_dependencies(install: bool = False) -> bool:
+    """
+    Check that the optional backends are installed (python gan.py --check-deps).
+    
+    Packages are looked up without being imported. Nothing is installed
+    unless install is set (python gan.py --check-deps --install).
+    
+    Args:
+        install: pip install missing packages
+        
+    Returns:
+        True if every package is available
+    """
     required_packages = {
-        'pydub': 'pydub',
         'SpeechRecognition': 'speech_recognition',
         'moviepy': 'moviepy',
         'Pillow': 'PIL',
         'numpy': 'numpy',
-        'opencv-python': 'cv2',
-        'gTTS': 'gtts'
+        'gTTS': 'gtts',
+        'imageio-ffmpeg': 'imageio_ffmpeg',
+        'opencv-python': 'cv2'
     }
     
-    missing_packages = []
+    missing_packages = [package for package, import_name in required_packages.items()
+                        if importlib.util.find_spec(import_name) is None]
     
-    for package, import_name in required_packages.items():
-        try:
-            __import__(import_name)
-        except ImportError:
-            missing_packages.append(package)
+    if not missing_packages:
+        print("All required packages are installed")
+        return True
     
-    if missing_packages:
-        print(f"Missing required packages: {', '.join(missing_packages)}")
-        print("Installing missing packages...")
-        
-        for package in missing_packages:
-            try:
-                subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-                print(f"Successfully installed {package}")
-            except subprocess.CalledProcessError:
-                print(f"Failed to install {package}. Please install it manually using:")
-                print(f"pip install {package}")
-                sys.exit(1)
+    print(f"Missing required packages: {', '.join(missing_packages)}")
+    if not install:
+        print(f"Install them with: pip install {' '.join(missing_packages)}")
+        return False
     
-    # After installing, import the required packages
-    global AudioSegment, sr
-    from pydub import AudioSegment
-    import speech_recognition as sr
-
-# Run dependency check at module level
-check_dependencies()
+    print("Installing missing packages...")
+    for package in missing_packages:
+        try:
+            subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+            print(f"Successfully installed {package}")
+        except subprocess.CalledProcessError:
+            print(f"Failed to install {package}. Please install it manually using:")
+            print(f"pip install {package}")
+            return False
+    return True
 
 class MultimediaProcessor:
-    def __init__(self, output_dir: str = "output"):
-        """Initialize the multimedia processor with output directory."""
+    def __init__(self, output_dir: str = "output", tts: Optional[TextToSpeech] = None,
+                 mixer: Optional[AudioMixer] = None):
+        """Initialize the multimedia processor with output directory, TTS layer and audio mixer."""
         self.output_dir = output_dir
+        self.tts = tts or default_tts()
+        self.mixer = mixer or default_mixer()
+        self.fps = 24
+        self.scale = 1.0  # Fraction of the image size actually rendered (see preview)
+        self.encode_options = None  # Codec parameters (None = encoder defaults)
         os.makedirs(output_dir, exist_ok=True)
+    
+    def preview(self, scale: float = PREVIEW_SCALE, fps: int = PREVIEW_FPS) -> "MultimediaProcessor":
+        """Return a copy of this processor that renders quick low-resolution previews."""
+        return preview_of(self, scale, fps)
         
-    def text_to_speech(self, dialogue_dict: Dict[str, str], lang: str = 'en') -> Dict[str, str]:
+    def text_to_speech(self, dialogue_dict: Dict[str, str], lang: str = 'en',
+                       voice: Optional[str] = None, max_workers: int = 4,
+                       timeout: Optional[float] = 60.0, retries: int = 2,
+                       backoff: float = 1.0, rate_limit: Optional[float] = None) -> Dict[str, str]:
         """
         Convert dialogue text to speech files.
         
+        Scenes are synthesized concurrently; repeated dialogue is served from
+        the TTS cache without a network round-trip.
+        
         Args:
             dialogue_dict: Dictionary with scene IDs and corresponding dialogue text
             lang: Language code for text-to-speech
+            voice: Backend-specific voice name
+            max_workers: Maximum number of concurrent synthesis requests (1 = sequential)
+            timeout: Per-request timeout in seconds
+            retries: Number of retries for a failed or timed-out request
+            backoff: Delay before the first retry in seconds, doubled on each retry
+            rate_limit: Maximum number of requests started per second
             
         Returns:
-            Dictionary mapping scene IDs to voice-over audio file paths
+            Dictionary mapping scene IDs to voice-over audio file paths, in
+            the order of dialogue_dict
         """
-        voice_overs = {}
-        for scene_id, text in dialogue_dict.items():
-            output_path = os.path.join(self.output_dir, f"voice_{scene_id}.mp3")
-            tts = gTTS(text=text, lang=lang)
-            tts.save(output_path)
-            voice_overs[scene_id] = output_path
-        return voice_overs
+        extension = self.tts.backend.extension
+
+        def synthesize(scene: Tuple[str, str]) -> str:
+            scene_id, text = scene
+            output_path = os.path.join(self.output_dir, f"voice_{scene_id}{extension}")
+            shutil.copyfile(self.tts.synthesize(text, lang, voice), output_path)
+            return output_path
+
+        paths = map_ordered(synthesize, dialogue_dict.items(), max_workers=max_workers,
+                            timeout=timeout, retries=retries, backoff=backoff,
+                            rate_limit=rate_limit)
+        return dict(zip(dialogue_dict, paths))
 
     def process_background_music(self, music_path: str, duration: float, 
-                               volume: float = 0.5) -> str:
+                               volume: float = 0.5, crossfade: float = 0.0) -> RenderResult:
         """
         Process background music for the video.
         
+        The track is looped (or trimmed) to exactly `duration` and streamed
+        to the encoder chunk by chunk; results are cached per source file,
+        duration, volume and crossfade.
+        
         Args:
             music_path: Path to background music file
             duration: Required duration in seconds
             volume: Volume level (0.0 to 1.0)
+            crossfade: Crossfade at each loop seam in seconds
             
         Returns:
-            Path to processed background music file
+            RenderResult with the path to the processed background music file
         """
+        render = begin_render("gan.background_music")
         try:
-            audio = AudioSegment.from_file(music_path)
-            
-            # Loop if audio is shorter than required duration
-            while len(audio) < duration * 1000:  # pydub works in milliseconds
-                audio = audio + audio
-                
-            # Trim to exact duration
-            audio = audio[:int(duration * 1000)]
-            
-            # Adjust volume
-            audio = audio - (20 * (1 - volume))  # Reduce volume by dB
+            # Reduce volume by up to 20 dB
+            cached_path = self.mixer.loop_to_file(music_path, duration, gain_db=-20 * (1 - volume),
+                                                  crossfade=crossfade)
             
             output_path = os.path.join(self.output_dir, "background_music.mp3")
-            audio.export(output_path, format="mp3")
-            return output_path
+            shutil.copyfile(cached_path, output_path)
+            return render.succeed(output_path)
         except Exception as e:
             print(f"Error processing background music: {str(e)}")
-            return None
+            return render.fail(e)
 
     def create_video_from_images(self, image_paths: List[str], 
-                               frame_duration: float = 3.0) -> str:
+                               frame_duration: float = 3.0,
+                               transition: Optional[str] = None,
+                               transition_duration: float = 1.0,
+                               ken_burns: bool = False) -> RenderResult:
         """
         Create video from a sequence of images.
         
+        Images are letterboxed to the size of the first one and decoded only
+        when the encoder reaches them, so memory use does not grow with the
+        number of images.
+        
         Args:
             image_paths: List of paths to image files
             frame_duration: Duration for each frame in seconds
+            transition: "morph" (optical-flow morph), "crossfade" or None
+                for hard cuts between images
+            transition_duration: Length of each transition in seconds
+            ken_burns: Slowly zoom and pan over each image
             
         Returns:
-            Path to output video file
+            RenderResult with the path to the output video file
         """
+        render = begin_render("gan.video_from_images")
         try:
-            clips = []
-            for img_path in image_paths:
-                image_clip = ImageClip(img_path).set_duration(frame_duration)
-                clips.append(image_clip)
-                
-            final_clip = concatenate_videoclips(clips)
             output_path = os.path.join(self.output_dir, "output_video.mp4")
-            final_clip.write_videofile(output_path, fps=24)
-            return output_path
+            if transition or ken_burns:
+                source = MotionSlideshow(image_paths, frame_duration, self.fps, scale=self.scale,
+                                         transition=transition, transition_duration=transition_duration,
+                                         ken_burns=ken_burns)
+            else:
+                source = ImageSequence(image_paths, frame_duration, self.fps, scale=self.scale)
+            with source as sequence:
+                with span("clip_build"):
+                    final_clip = sequence.clip()
+                with span("encode"):
+                    options = self.encode_options or EncodeOptions()
+                    crf = ["-crf", str(options.crf)] if options.crf is not None else None
+                    final_clip.write_videofile(output_path, fps=self.fps, preset=options.preset,
+                                               ffmpeg_params=crf)
+                with span("cleanup"):
+                    final_clip.close()
+            return render.succeed(output_path)
         except Exception as e:
             print(f"Error creating video from images: {str(e)}")
-            return None
+            return render.fail(e)
 
     def combine_audio_video(self, video_path: str, 
                           voice_overs: Dict[str, str], 
-                          background_music_path: str) -> str:
+                          background_music_path: str,
+                          duck_db: Optional[float] = None) -> RenderResult:
         """
         Combine video with voice-overs and background music.
         
@@ -149,68 +206,109 @@ class MultimediaProcessor:
             video_path: Path to video file
             voice_overs: Dictionary mapping scene IDs to voice-over audio paths
             background_music_path: Path to background music file
+            duck_db: Lower the music by this many dB while a voice-over plays
             
         Returns:
-            Path to final video with audio
+            RenderResult with the path to the final video with audio
         """
+        render = begin_render("gan.combine_audio_video")
         try:
-            video = VideoFileClip(video_path)
-            bg_music = AudioFileClip(background_music_path)
+            # Only the container header is read; the video stream is copied as is
+            video_path = os.fspath(video_path)
+            video_duration = ffmpeg_reader.ffmpeg_parse_infos(video_path)["duration"]
             
-            # Combine all voice-overs
-            voice_clips = []
-            current_time = 0
-            for scene_id, audio_path in voice_overs.items():
-                voice = AudioFileClip(audio_path)
-                voice = voice.set_start(current_time)
-                voice_clips.append(voice)
-                current_time += voice.duration
-                
-            # Mix background music with voice-overs
-            final_audio = CompositeAudioClip([bg_music] + voice_clips)
-            final_video = video.set_audio(final_audio)
+            # Voice-overs play back to back over the music, mixed once and cached
+            with span("audio_mix"):
+                mixed_path = self.mixer.mix_to_file(video_duration, os.fspath(background_music_path),
+                                                    list(voice_overs.values()), duck_db=duck_db)
             
             output_path = os.path.join(self.output_dir, "final_video.mp4")
-            final_video.write_videofile(output_path)
-            return output_path
+            with span("mux"):
+                mux_audio(video_path, output_path, mixed_path, duration=video_duration,
+                          options=self.encode_options)
+            return render.succeed(output_path)
         except Exception as e:
             print(f"Error combining audio and video: {str(e)}")
-            return None
+            return render.fail(e)
 
-    def transcribe_video(self, video_path: str) -> str:
+    def create_multimedia_video(self, dialogue_dict: Dict[str, str], image_paths: List[str],
+                                music_path: str, frame_duration: float = 3.0,
+                                music_volume: float = 0.3, lang: str = 'en',
+                                duck_db: Optional[float] = None) -> RenderResult:
+        """
+        Run the full pipeline: voice-overs, background music, slideshow and mix.
+        
+        Args:
+            dialogue_dict: Dictionary with scene IDs and corresponding dialogue text
+            image_paths: List of paths to image files
+            music_path: Path to background music file
+            frame_duration: Duration for each image in seconds
+            music_volume: Background music volume (0.0 to 1.0)
+            lang: Language code for text-to-speech
+            duck_db: Lower the music by this many dB under the voice-overs
+            
+        Returns:
+            RenderResult with the path to the final video, falsy if a stage failed
+        """
+        render = begin_render("gan.multimedia_video")
+        try:
+            with span("tts"):
+                voice_overs = self.text_to_speech(dialogue_dict, lang=lang)
+        except Exception as e:
+            print(f"Error creating voice-overs: {str(e)}")
+            return render.fail(e)
+        with span("music"):
+            bg_music = self.process_background_music(
+                music_path, duration=len(image_paths) * frame_duration, volume=music_volume)
+        if not bg_music:
+            return render.fail(f"processing background music failed: {bg_music.error}")
+        video_path = self.create_video_from_images(image_paths, frame_duration)
+        if not video_path:
+            return render.fail(f"creating video from images failed: {video_path.error}")
+        output_path = self.combine_audio_video(video_path, voice_overs, bg_music, duck_db=duck_db)
+        if not output_path:
+            return render.fail(f"combining audio and video failed: {output_path.error}")
+        return render.succeed(output_path.output)
+
+    def transcribe_video(self, video_path: str, lang: str = 'en-US', max_workers: int = 4) -> str:
         """
         Generate transcription from video audio.
         
         Args:
             video_path: Path to video file
+            lang: Language code for speech recognition
+            max_workers: Maximum number of concurrent recognition requests
             
         Returns:
             Transcribed text
         """
         try:
-            video = VideoFileClip(video_path)
-            audio_path = os.path.join(self.output_dir, "temp_audio.wav")
-            video.audio.write_audiofile(audio_path)
-            
-            recognizer = sr.Recognizer()
-            transcription = []
-            
-            with sr.AudioFile(audio_path) as source:
-                audio = recognizer.record(source)
-                try:
-                    text = recognizer.recognize_google(audio)
-                    transcription.append(text)
-                except sr.UnknownValueError:
-                    print("Speech recognition could not understand the audio")
-                except sr.RequestError:
-                    print("Could not request results from speech recognition service")
-                    
-            os.remove(audio_path)  # Clean up temporary file
-            return " ".join(transcription)
+            segments = self.transcribe_segments(video_path, lang=lang, max_workers=max_workers)
+            return " ".join(segment.text for segment in segments)
         except Exception as e:
             print(f"Error transcribing video: {str(e)}")
             return ""
 
+    def transcribe_segments(self, video_path: str, lang: str = 'en-US', max_workers: int = 4,
+                            recognizer: Optional[Recognizer] = None) -> Iterator[TranscriptSegment]:
+        """
+        Transcribe video audio as timestamped segments, streamed as they are recognized.
+        
+        The audio is decoded in memory and split at pauses; chunks are
+        recognized concurrently and yielded in order.
+        
+        Args:
+            video_path: Path to video file
+            lang: Language code for speech recognition
+            max_workers: Maximum number of concurrent recognition requests
+            recognizer: Recognition backend (defaults to VIDEOGEN_RECOGNIZER, or Google)
+            
+        Returns:
+            Generator of TranscriptSegment(start, end, text)
+        """
+        return transcribe_stream(video_path, recognizer=recognizer, lang=lang,
+                                 max_workers=max_workers)
+
     def summarize_dialogue(self, text: str, max_length: int = 100) -> str:
         """
         Create a summary of dialogue text.
@@ -262,14 +360,14 @@ def main():
         volume=0.3
     )
     
-    if bg_music is None:
+    if not bg_music:
         print("Failed to process background music. Exiting.")
         return
     
     # Create video from images
     video_path = processor.create_video_from_images(image_paths)
     
-    if video_path is None:
+    if not video_path:
         print("Failed to create video from images. Exiting.")
         return
     
@@ -280,7 +378,7 @@ def main():
         bg_music
     )
     
-    if final_video is None:
+    if not final_video:
         print("Failed to combine audio and video. Exiting.")
         return
     
@@ -295,4 +393,6 @@ def main():
     print(f"Summary: {summary}")
 
 if __name__ == "__main__":
+    if "--check-deps" in sys.argv[1:]:
+        sys.exit(0 if check_dependencies(install="--install" in sys.argv[1:]) else 1)
     main()
\ No newline at end of file
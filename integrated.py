@@ -1,143 +1,198 @@
 import os
-import random
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-from gtts import gTTS
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, CompositeVideoClip, concatenate_videoclips
-import cv2
+from PIL import Image
+from lazy import lazy_import
+from slides import pick_background, render_text_frame
+from tts import default_tts
+from encoder import still_spans, write_clip, write_spans
+from transitions import faded_clip
+from timeline import TimelineCompositor
+from segments import StillSegment, default_segment_cache, render_segments
+from metrics import begin_render, span
+from preview import PREVIEW_FPS, PREVIEW_SCALE, preview_of
+from sequence import ImageSequence
+from motion import MotionSlideshow
+
+moviepy = lazy_import("moviepy.editor")
 
 class IntegratedVideoGenerator:
-    def __init__(self, width=1280, height=720, output_dir="output"):
+    def __init__(self, width=1280, height=720, output_dir="output", seed=None, slide_cache=None,
+                 tts=None, fast_still=True, segment_workers=None,
+                 incremental=False, segment_cache=None):
         self.width = width
         self.height = height
         self.output_dir = output_dir
+        self.seed = seed  # Makes background choices repeatable, so slides hit the cache
+        self.slide_cache = slide_cache
+        self.tts = tts or default_tts()
+        self.fast_still = fast_still  # Encode still slides as spans instead of per-frame clips
+        self.segment_workers = segment_workers  # Encode slides in parallel processes and join them
+        # Reuse the encoded slides that did not change since an earlier render
+        self.segment_cache = segment_cache or (default_segment_cache() if incremental else None)
+        self.fps = 24
+        self.scale = 1.0  # Fraction of width x height actually rendered (see preview)
+        self.encode_options = None  # Codec parameters (None = encoder defaults)
         os.makedirs(output_dir, exist_ok=True)
         
     def create_text_image(self, text, font_size=60):
         """Create an image with text and random background color"""
         background_colors = ["white", "yellow", "pink"]
-        background_color = random.choice(background_colors)
+        background_color = pick_background(background_colors, text, self.seed)
         color_map = {
             "white": (255, 255, 255),
             "yellow": (255, 255, 0),
             "pink": (255, 192, 203)
         }
         
-        image = Image.new('RGB', (self.width, self.height), color_map[background_color])
-        draw = ImageDraw.Draw(image)
-        
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-        
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        x = (self.width - text_width) // 2
-        y = (self.height - text_height) // 2
-        
-        draw.text((x, y), text, fill='black', font=font)
-        return image
+        frame = render_text_frame(text, self.width, self.height, color_map[background_color],
+                                  font_size, 'black', cache=self.slide_cache, scale=self.scale)
+        return Image.fromarray(frame)
+    
+    def preview(self, scale=PREVIEW_SCALE, fps=PREVIEW_FPS):
+        """Return a copy of this generator that renders quick low-resolution previews"""
+        return preview_of(self, scale, fps)
     
     def create_text_video(self, text, duration=5, output_filename="text_video.mp4"):
         """Create a video with text and speech"""
+        render = begin_render("integrated.text_video")
         try:
             # Create text image
-            image = self.create_text_image(text)
-            temp_image_path = os.path.join(self.output_dir, "temp_frame.png")
-            image.save(temp_image_path)
+            with span("text_render"):
+                image = self.create_text_image(text)
             
             # Generate speech
-            temp_audio_path = os.path.join(self.output_dir, "temp_audio.mp3")
-            tts = gTTS(text=text, lang='en')
-            tts.save(temp_audio_path)
-            
-            # Create video clip
-            image_clip = ImageClip(temp_image_path).set_duration(duration)
-            audio_clip = AudioFileClip(temp_audio_path)
-            
-            video = image_clip.set_audio(audio_clip)
+            with span("tts"):
+                audio_path = self.tts.synthesize(text, lang='en')
             output_path = os.path.join(self.output_dir, output_filename)
             
-            video.write_videofile(output_path, fps=24)
-            
-            # Clean up temporary files
-            os.remove(temp_image_path)
-            os.remove(temp_audio_path)
+            if self.fast_still:
+                # The frame never changes: pipe one buffer to ffmpeg for the whole duration
+                with span("encode"):
+                    spans = still_spans(np.array(image), duration, self.fps)
+                    write_spans(spans, output_path, self.fps, audio_path=audio_path,
+                                options=self.encode_options)
+                print(f"Video created successfully: {output_path}")
+                return render.succeed(output_path)
+            
+            # Create video clip from the in-memory frame and mux the cached speech in directly
+            with span("clip_build"):
+                image_clip = moviepy.ImageClip(np.array(image)).set_duration(duration)
+            with span("encode"):
+                write_clip(image_clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                image_clip.close()
             
             print(f"Video created successfully: {output_path}")
-            return output_path
+            return render.succeed(output_path)
             
         except Exception as e:
             print(f"Error creating video: {str(e)}")
-            return None
+            return render.fail(e)
     
-    def create_multi_text_video(self, text_list, output_filename="multi_text_video.mp4"):
-        """Create a video with multiple text slides"""
+    def create_multi_text_video(self, text_list, output_filename="multi_text_video.mp4", crossfade=False):
+        """Create a video with multiple text slides, faded through black or crossfaded"""
+        render = begin_render("integrated.multi_text_video")
         try:
-            clips = []
+            segments = []
             duration_per_text = 3
+            previous = None
             
             for i, text in enumerate(text_list):
                 # Create image with text
-                text_image = self.create_text_image(text)
-                temp_image_path = os.path.join(self.output_dir, f"temp_frame_{i}.png")
-                text_image.save(temp_image_path)
+                with span("text_render"):
+                    frame = np.array(self.create_text_image(text))
                 
-                # Create clip
-                clip = ImageClip(temp_image_path).set_duration(duration_per_text)
-                clip = clip.set_start(i * duration_per_text)
-                clip = clip.fadeout(1).fadein(1)
-                
-                clips.append(clip)
-                os.remove(temp_image_path)
+                # Describe the slide with its fades
+                last = i == len(text_list) - 1
+                segments.append(StillSegment(frame, duration_per_text, fade_in=1,
+                                             fade_out=0 if crossfade and not last else 1,
+                                             previous=previous if crossfade else None))
+                previous = frame
             
             # Generate speech
-            temp_audio_path = os.path.join(self.output_dir, "temp_multi_audio.mp3")
-            tts = gTTS(text=" ".join(text_list), lang='en')
-            tts.save(temp_audio_path)
+            with span("tts"):
+                audio_path = self.tts.synthesize(" ".join(text_list), lang='en')
+            output_path = os.path.join(self.output_dir, output_filename)
             
-            # Combine clips
-            final_clip = CompositeVideoClip(clips)
-            audio_clip = AudioFileClip(temp_audio_path)
-            final_clip = final_clip.set_audio(audio_clip)
+            if self.segment_workers or self.segment_cache is not None:
+                # Encode each slide separately and join them without re-encoding
+                with span("encode"):
+                    render_segments(segments, output_path, self.fps, audio_path=audio_path,
+                                    options=self.encode_options, workers=self.segment_workers,
+                                    cache=self.segment_cache)
+                print(f"Multi-text video created: {output_path}")
+                return render.succeed(output_path)
+            
+            # Create clips with precomputed fades
+            with span("clip_build"):
+                clips = []
+                for i, segment in enumerate(segments):
+                    clip = faded_clip(segment.frame, segment.duration, self.fps, segment.fade_in,
+                                      segment.fade_out, segment.previous)
+                    clips.append(clip.set_start(i * duration_per_text))
+            
+            # Combine clips; only the slides active at each frame are composited
+            with span("composite"):
+                final_clip = TimelineCompositor(clips).clip()
             
             # Write video
-            output_path = os.path.join(self.output_dir, output_filename)
-            final_clip.write_videofile(output_path, fps=24)
-            
-            os.remove(temp_audio_path)
+            with span("encode"):
+                write_clip(final_clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                final_clip.close()
             
             print(f"Multi-text video created: {output_path}")
-            return output_path
+            return render.succeed(output_path)
             
         except Exception as e:
             print(f"Error creating multi-text video: {str(e)}")
-            return None
+            return render.fail(e)
     
-    def create_image_video(self, image_paths, frame_duration=3.0, output_filename="image_video.mp4"):
-        """Create a video from a sequence of images"""
+    def create_image_video(self, image_paths, frame_duration=3.0, output_filename="image_video.mp4",
+                           transition=None, transition_duration=1.0, ken_burns=False):
+        """Create a video from a sequence of images, letterboxed to the (scaled) size of the first one
+
+        transition is "morph" (optical-flow morph), "crossfade" or None for
+        hard cuts; ken_burns slowly zooms and pans over each image (see
+        motion.MotionSlideshow).
+        """
+        render = begin_render("integrated.image_video")
         try:
-            clips = []
             for img_path in image_paths:
                 if not os.path.exists(img_path):
                     raise FileNotFoundError(f"Image file not found: {img_path}")
-                
-                image_clip = ImageClip(img_path).set_duration(frame_duration)
-                clips.append(image_clip)
-            
-            final_clip = concatenate_videoclips(clips)
             output_path = os.path.join(self.output_dir, output_filename)
-            final_clip.write_videofile(output_path, fps=24)
+            
+            # Images are decoded just ahead of the encoder and dropped once shown
+            if transition or ken_burns:
+                source = MotionSlideshow(image_paths, frame_duration, self.fps, scale=self.scale,
+                                         transition=transition, transition_duration=transition_duration,
+                                         ken_burns=ken_burns)
+            else:
+                source = ImageSequence(image_paths, frame_duration, self.fps, scale=self.scale)
+            with source as sequence:
+                if self.fast_still:
+                    with span("encode"):
+                        write_spans(sequence.spans(), output_path, self.fps,
+                                    options=self.encode_options)
+                    print(f"Image video created: {output_path}")
+                    return render.succeed(output_path)
+                
+                with span("clip_build"):
+                    final_clip = sequence.clip()
+                with span("encode"):
+                    write_clip(final_clip, output_path, self.fps, options=self.encode_options)
+                with span("cleanup"):
+                    final_clip.close()
             
             print(f"Image video created: {output_path}")
-            return output_path
+            return render.succeed(output_path)
         
         except Exception as e:
             print(f"Error creating image video: {str(e)}")
-            return None
+            return render.fail(e)
 
 def main():
     # Create output directory
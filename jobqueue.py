@@ -0,0 +1,263 @@
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL,          -- queued, running, ok or failed
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    token TEXT,                    -- identifies the current lease
+    lease_expires REAL,
+    available_at REAL NOT NULL,    -- not claimed before this time (retry backoff)
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, created);
+"""
+
+
+class Lease:
+    def __init__(self, job_id: str, token: str, spec: dict, attempt: int, expires: float):
+        """A claimed job: only the holder of the token may renew, complete or fail it."""
+        self.job_id = job_id
+        self.token = token
+        self.spec = spec
+        self.attempt = attempt
+        self.expires = expires
+
+    def __repr__(self):
+        return f"<Lease {self.job_id} attempt {self.attempt}>"
+
+
+class JobQueue:
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3,
+                 retry_delay: float = 5.0):
+        """
+        Lease-based job queue in a SQLite file, shared by workers on one or more hosts.
+
+        A worker claims a job for lease_seconds and renews the lease while
+        it runs. A worker that dies stops renewing; once its lease expires,
+        the job goes to the next worker that asks. Failed and expired
+        attempts are retried after a growing delay until max_attempts
+        attempts were made. Every claim is a single write transaction, so
+        two workers never hold the same job.
+
+        For several hosts, put the file on a shared volume whose locking
+        SQLite can rely on (a local disk, or NFS with working locks); the
+        queue avoids WAL mode, which needs shared memory on one host.
+
+        Args:
+            path: SQLite database file (created if missing)
+            lease_seconds: Time a claim is valid without renewal
+            max_attempts: Attempts made before a job is failed for good
+            retry_delay: Delay before the first retry; doubles on each further retry
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connection in autocommit mode; callers open their own transactions."""
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def submit(self, spec: dict, priority: int = 0) -> str:
+        """
+        Add a job.
+
+        The job id is spec["id"] if present, otherwise a new one. Submitting
+        an id again replaces a finished job, and leaves a queued or running
+        one untouched.
+
+        Returns:
+            Job id
+        """
+        return self.submit_many([spec], priority)[0]
+
+    def submit_many(self, specs: Iterable[dict], priority: int = 0) -> List[str]:
+        """Add several jobs in one transaction; returns their ids."""
+        now = time.time()
+        ids = []
+        with self._transaction() as db:
+            for spec in specs:
+                job_id = str(spec.get("id") or uuid.uuid4().hex)
+                spec = dict(spec, id=job_id)
+                db.execute(
+                    "INSERT INTO jobs (id, spec, status, priority, max_attempts, available_at, created)"
+                    " VALUES (?, ?, 'queued', ?, ?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET spec = excluded.spec, status = 'queued',"
+                    " priority = excluded.priority, attempts = 0, max_attempts = excluded.max_attempts,"
+                    " worker = NULL, token = NULL, lease_expires = NULL,"
+                    " available_at = excluded.available_at, created = excluded.created,"
+                    " started = NULL, finished = NULL, result = NULL, error = NULL"
+                    " WHERE status IN ('ok', 'failed')",
+                    (job_id, json.dumps(spec), priority, self.max_attempts, now, now))
+                ids.append(job_id)
+        return ids
+
+    def claim(self, worker: str) -> Optional[Lease]:
+        """
+        Lease the next job that is ready, if any.
+
+        Ready jobs are queued ones whose retry delay has passed and running
+        ones whose lease expired; the highest priority, then the oldest,
+        goes first. Expired jobs that have no attempts left are failed here.
+
+        Args:
+            worker: Name of the claiming worker, recorded with the job
+
+        Returns:
+            The lease, or None if no job is ready
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, token = NULL,"
+                " error = 'lease expired on the last attempt (worker ' || COALESCE(worker, '?') || ')'"
+                " WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now))
+            row = db.execute(
+                "SELECT id, spec, attempts FROM jobs"
+                " WHERE (status = 'queued' AND available_at <= ?)"
+                " OR (status = 'running' AND lease_expires < ?)"
+                " ORDER BY priority DESC, created LIMIT 1",
+                (now, now)).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            expires = now + self.lease_seconds
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, token = ?,"
+                " lease_expires = ?, started = ? WHERE id = ?",
+                (worker, token, expires, now, row["id"]))
+        return Lease(row["id"], token, json.loads(row["spec"]), row["attempts"] + 1, expires)
+
+    def renew(self, lease: Lease) -> bool:
+        """
+        Extend a lease by lease_seconds.
+
+        Returns:
+            False if the lease was lost (it expired and the job was claimed
+            again, or the job finished); the holder should stop working on it
+        """
+        expires = time.time() + self.lease_seconds
+        with self._transaction() as db:
+            updated = db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND token = ? AND status = 'running'",
+                (expires, lease.job_id, lease.token)).rowcount
+        if updated:
+            lease.expires = expires
+        return bool(updated)
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        """Mark a leased job done; returns False if the lease was lost and nothing changed."""
+        with self._transaction() as db:
+            return bool(db.execute(
+                "UPDATE jobs SET status = 'ok', finished = ?, token = NULL, result = ?, error = NULL"
+                " WHERE id = ? AND token = ? AND status = 'running'",
+                (time.time(), json.dumps(result), lease.job_id, lease.token)).rowcount)
+
+    def fail(self, lease: Lease, error: str, result: Optional[Dict] = None, retry: bool = True) -> bool:
+        """
+        Record a failed attempt.
+
+        The job is queued again after retry_delay * 2 ** (attempt - 1)
+        seconds if retry is set and attempts are left, and failed otherwise.
+
+        Returns:
+            False if the lease was lost and nothing changed
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND token = ?"
+                             " AND status = 'running'", (lease.job_id, lease.token)).fetchone()
+            if row is None:
+                return False
+            again = retry and row["attempts"] < row["max_attempts"]
+            db.execute(
+                "UPDATE jobs SET status = ?, token = NULL, lease_expires = NULL, available_at = ?,"
+                " finished = ?, error = ?, result = ? WHERE id = ?",
+                ("queued" if again else "failed", now + self.retry_delay * 2 ** (row["attempts"] - 1),
+                 None if again else now, error, json.dumps(result) if result is not None else None,
+                 lease.job_id))
+        return True
+
+    def release(self, lease: Lease) -> bool:
+        """
+        Give a job back without counting the attempt, e.g. when its worker is stopped.
+
+        The job is queued again at once, with the attempts it had before it
+        was claimed.
+
+        Returns:
+            False if the lease was lost and nothing changed
+        """
+        with self._transaction() as db:
+            return bool(db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), worker = NULL,"
+                " token = NULL, lease_expires = NULL, available_at = ?, started = NULL"
+                " WHERE id = ? AND token = ? AND status = 'running'",
+                (time.time(), lease.job_id, lease.token)).rowcount)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Current record of a job, or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _record(row) if row is not None else None
+
+    def jobs(self, status: Optional[str] = None) -> List[Dict]:
+        """Records of every job, or of those with a status, oldest first."""
+        with self._connect() as db:
+            if status is None:
+                rows = db.execute("SELECT * FROM jobs ORDER BY created").fetchall()
+            else:
+                rows = db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created",
+                                  (status,)).fetchall()
+        return [_record(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "running": 0, "ok": 0, "failed": 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+def _record(row: sqlite3.Row) -> Dict:
+    record = dict(row)
+    record.pop("token")
+    record["spec"] = json.loads(record["spec"])
+    record["result"] = json.loads(record["result"]) if record["result"] else None
+    return record
@@ -0,0 +1,45 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        """
+        Stand-in for a module that is imported on first attribute access.
+
+        Heavy backends (MoviePy, OpenCV, speech services) cost seconds of
+        cold start; generators reference them through a LazyModule so that
+        importing a generator, or a worker process that never uses a
+        backend, does not pay for it.
+
+        Args:
+            name: Dotted module name
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Return a module proxy that imports `name` when first used."""
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    """Whether a module has actually been imported in this process."""
+    return name in sys.modules
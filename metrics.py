@@ -0,0 +1,290 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Environment variables enabling the exporters
+LOG_ENV = "VIDEOGEN_METRICS_LOG"  # JSON lines, one per render ("-" for stderr)
+PROMETHEUS_ENV = "VIDEOGEN_METRICS_FILE"  # Prometheus text file, rewritten after each render
+
+_active = threading.local()
+
+
+class RenderResult:
+    def __init__(self, kind: str):
+        """
+        Outcome of one render, filled in while it runs.
+
+        Truthy only if the render succeeded, so code that checked the old
+        path-or-None and True/False returns keeps working; the output path
+        is available as .output, str(result) or os.fspath(result).
+
+        Args:
+            kind: Name of the generator method, e.g. "integrated.multi_text"
+        """
+        self.kind = kind
+        self.output: Optional[str] = None
+        self.error: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.seconds = 0.0
+        self._started = time.perf_counter()
+        self._parent: Optional["RenderResult"] = None
+        self._on_finish: List[Callable[[], None]] = []
+
+    @property
+    def ok(self) -> bool:
+        return self.output is not None and self.error is None
+
+    def __bool__(self):
+        return self.ok
+
+    def __str__(self):
+        return self.output or ""
+
+    def __fspath__(self):
+        if self.output is None:
+            raise TypeError(f"{self.kind} render has no output: {self.error}")
+        return self.output
+
+    def __repr__(self):
+        status = f"output={self.output!r}" if self.ok else f"error={self.error!r}"
+        return f"<RenderResult {self.kind} {status} {self.seconds:.2f}s>"
+
+    def to_dict(self) -> Dict:
+        return {"kind": self.kind, "status": "ok" if self.ok else "failed", "output": self.output,
+                "error": self.error, "seconds": round(self.seconds, 4),
+                "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                "counters": dict(self.counters)}
+
+    def succeed(self, output: str) -> "RenderResult":
+        """Record the output file and publish the render's metrics."""
+        self.output = output
+        try:
+            self.counters["bytes_written"] = os.path.getsize(output)
+        except OSError:
+            pass
+        return self._finish()
+
+    def fail(self, error) -> "RenderResult":
+        """Record an error (exception or message) and publish the render's metrics."""
+        self.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+        return self._finish()
+
+    def on_finish(self, callback: Callable[[], None]):
+        """
+        Run callback when this render finishes, or, if it is nested, when
+        the outermost render it runs in finishes (its files may still be in use).
+        """
+        self._on_finish.append(callback)
+
+    def _finish(self) -> "RenderResult":
+        self.seconds = time.perf_counter() - self._started
+        if getattr(_active, "render", None) is self:
+            _active.render = self._parent
+        if self._parent is not None:
+            # A nested render's stages are also stages of the render it runs in
+            for stage, seconds in self.stages.items():
+                self._parent.stages[stage] = self._parent.stages.get(stage, 0.0) + seconds
+            for name, value in self.counters.items():
+                self._parent.counters[name] = self._parent.counters.get(name, 0) + value
+            self._parent._on_finish.extend(self._on_finish)
+            self._parent = None
+        else:
+            for callback in self._on_finish:
+                callback()
+        self._on_finish = []
+        registry.record_render(self)
+        return self
+
+
+def begin_render(kind: str) -> RenderResult:
+    """
+    Start tracing a render on this thread; spans and counts are attributed to it.
+
+    A render started while another is being traced is nested in it: when
+    it finishes, the outer render is traced again and receives its stage
+    times and counters.
+    """
+    render = RenderResult(kind)
+    render._parent = current_render()
+    _active.render = render
+    return render
+
+
+def current_render() -> Optional[RenderResult]:
+    """The render being traced on this thread, if any."""
+    return getattr(_active, "render", None)
+
+
+def watch_stages(listener: Optional[Callable[[str, str, float], None]]):
+    """
+    Report stages on this thread as they run, for progress reporting.
+
+    listener(event, stage, seconds) is called with "start" (and 0.0) when
+    a span opens and with "end" and its duration when it closes. Errors
+    raised by the listener are ignored. Pass None to stop.
+    """
+    _active.listener = listener
+
+
+def _notify(event: str, stage: str, seconds: float):
+    listener = getattr(_active, "listener", None)
+    if listener is not None:
+        try:
+            listener(event, stage, seconds)
+        except Exception:
+            pass
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a pipeline stage.
+
+    The duration is added to the current render (repeated stages add up)
+    and to the process-wide stage summary. Costs two clock reads and a
+    lock, so it is cheap enough to leave on.
+    """
+    _notify("start", stage, 0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _notify("end", stage, seconds)
+        render = current_render()
+        if render is not None:
+            render.stages[stage] = render.stages.get(stage, 0.0) + seconds
+        registry.observe("stage_seconds", seconds, stage=stage)
+
+
+def count(name: str, value: float = 1):
+    """Add to a counter of the current render and to the process-wide counter."""
+    render = current_render()
+    if render is not None:
+        render.counters[name] = render.counters.get(name, 0) + value
+    registry.inc(f"{name}_total", value)
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "videogen"):
+        """
+        Process-wide counters and summaries with JSON-log and Prometheus exporters.
+
+        Args:
+            prefix: Prefix of every exported metric name
+        """
+        self.prefix = prefix
+        self._counters: Dict[Tuple, float] = {}
+        self._summaries: Dict[Tuple, list] = {}
+        self._caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name,) + tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.setdefault(key, [0.0, 0])
+            summary[0] += value
+            summary[1] += 1
+
+    def register_cache(self, name: str, stats: Callable[[], Dict[str, int]]):
+        """Export a cache's hit and miss counters (stats() must return hits and misses)."""
+        with self._lock:
+            self._caches[name] = stats
+
+    def record_render(self, render: RenderResult):
+        status = "ok" if render.ok else "failed"
+        self.inc("renders_total", kind=render.kind, status=status)
+        self.observe("render_seconds", render.seconds, kind=render.kind)
+        log = os.environ.get(LOG_ENV)
+        if log:
+            self.log_json(dict(render.to_dict(), event="render", time=time.time()), log)
+        path = os.environ.get(PROMETHEUS_ENV)
+        if path:
+            self.write_prometheus(path)
+
+    def log_json(self, record: Dict, destination: str = "-"):
+        """Append one JSON line to a file, or to stderr for "-"."""
+        line = json.dumps(record, default=str) + "\n"
+        if destination == "-":
+            sys.stderr.write(line)
+            return
+        with self._lock, open(destination, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def snapshot(self) -> Dict:
+        """Current counters, summaries and cache statistics."""
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: tuple(value) for key, value in self._summaries.items()}
+            caches = dict(self._caches)
+        cache_stats = {}
+        for name, stats in caches.items():
+            try:
+                cache_stats[name] = stats()
+            except Exception:
+                continue
+        return {"counters": counters, "summaries": summaries, "caches": cache_stats}
+
+    def prometheus_text(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def emit(name, kind, labels, value, suffix=""):
+            name = f"{self.prefix}_{name}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            sample = name + suffix + (f"{{{label_text}}}" if label_text else "")
+            lines.append(f"{sample} {value}")
+
+        for (name, *labels), value in sorted(snapshot["counters"].items(), key=repr):
+            emit(name, "counter", labels, value)
+        for (name, *labels), (total, n) in sorted(snapshot["summaries"].items(), key=repr):
+            emit(name, "summary", labels, round(total, 6), "_sum")
+            emit(name, "summary", labels, n, "_count")
+        caches = []
+        for cache, stats in sorted(snapshot["caches"].items()):
+            hits = stats.get("hits", stats.get("memory_hits", 0) + stats.get("disk_hits", 0))
+            caches.append((cache, hits, stats.get("misses", 0)))
+        for cache, hits, _ in caches:
+            emit("cache_hits_total", "counter", [("cache", cache)], hits)
+        for cache, _, misses in caches:
+            emit("cache_misses_total", "counter", [("cache", cache)], misses)
+        for cache, hits, misses in caches:
+            if hits + misses:
+                emit("cache_hit_ratio", "gauge", [("cache", cache)], round(hits / (hits + misses), 4))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically rewrite a Prometheus text file (for node_exporter's textfile collector)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
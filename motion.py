@@ -0,0 +1,305 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from encoder import FrameSpan
+from lazy import lazy_import
+from preview import even_size, scaled_size
+from sequence import ImageSequence
+
+cv2 = lazy_import("cv2")
+moviepy = lazy_import("moviepy.editor")
+
+TRANSITIONS = ("crossfade", "morph")
+
+# Width optical flow is estimated at; the flow is scaled up to the frame size
+FLOW_WIDTH = 480
+
+
+def ken_burns_matrices(width: int, height: int, count: int, zoom: float = 1.15,
+                       zoom_in: bool = True, pan: Tuple[float, float] = (0.0, 0.0)) -> np.ndarray:
+    """
+    Affine maps of a slow zoom and pan over an image, one per frame.
+
+    The image is expected at `zoom` times the output size, so the closest
+    view still samples it at full resolution. The view moves between the
+    whole image and a window 1/zoom of its size. The window starts centered
+    and drifts toward `pan` (in [-1, 1] per axis, as a fraction of the
+    room the window has on that side).
+
+    Args:
+        width: Output width
+        height: Output height
+        count: Number of frames
+        zoom: Largest magnification
+        zoom_in: Zoom in over the clip (otherwise out)
+        pan: Direction the window drifts in, (x, y)
+
+    Returns:
+        count x 2 x 3 float64 matrices for cv2.warpAffine, source to output
+    """
+    progress = np.linspace(0.0, 1.0, count) if count > 1 else np.zeros(count)
+    # Ease in and out so the motion does not jerk at the ends
+    progress = progress * progress * (3 - 2 * progress)
+    magnification = 1 + (zoom - 1) * (progress if zoom_in else 1 - progress)
+    source_w, source_h = width * zoom, height * zoom
+    window_w, window_h = source_w / magnification, source_h / magnification
+    center_x = source_w / 2 + pan[0] * progress * (source_w - window_w) / 2
+    center_y = source_h / 2 + pan[1] * progress * (source_h - window_h) / 2
+    factor = width / window_w
+    matrices = np.zeros((count, 2, 3))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = factor
+    matrices[:, 0, 2] = -factor * (center_x - window_w / 2)
+    matrices[:, 1, 2] = -factor * (center_y - window_h / 2)
+    return matrices
+
+
+def dense_flow(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Optical flow from source to target (Farneback), estimated at FLOW_WIDTH.
+
+    Returns:
+        HxWx2 float32 displacement of each source pixel, in full-size pixels
+    """
+    height, width = source.shape[:2]
+    factor = min(1.0, FLOW_WIDTH / width)
+    small = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+    gray = [cv2.cvtColor(cv2.resize(frame, small, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+            for frame in (source, target)]
+    flow = cv2.calcOpticalFlowFarneback(gray[0], gray[1], None, pyr_scale=0.5, levels=4,
+                                        winsize=21, iterations=3, poly_n=7, poly_sigma=1.5, flags=0)
+    if factor == 1.0:
+        return flow
+    return cv2.resize(flow, (width, height), interpolation=cv2.INTER_LINEAR) / factor
+
+
+class _Morph:
+    def __init__(self, source: np.ndarray, target: np.ndarray):
+        """Flow field and sampling grid shared by every frame of one morph."""
+        self.source = source
+        self.target = target
+        self.flow = dense_flow(source, target)
+        height, width = source.shape[:2]
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        self.grid = np.ascontiguousarray(np.dstack([xs, ys]))
+
+    def frame(self, t: float) -> np.ndarray:
+        """
+        Motion-compensated blend at t in (0, 1).
+
+        Both images are warped to where their content is at time t, the
+        source forward along the flow and the target back along it, and
+        blended with weight t.
+        """
+        # Sampling maps grid - t * flow and grid + (1 - t) * flow, as HxWx2 maps
+        source = cv2.remap(self.source, cv2.scaleAdd(self.flow, -t, self.grid), None,
+                           cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        target = cv2.remap(self.target, cv2.scaleAdd(self.flow, 1 - t, self.grid), None,
+                           cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return cv2.addWeighted(source, 1 - t, target, t, 0)
+
+
+class _Crossfade:
+    def __init__(self, source: np.ndarray, target: np.ndarray):
+        """Plain blend, for transition="crossfade"."""
+        self.source = source
+        self.target = target
+
+    def frame(self, t: float) -> np.ndarray:
+        return cv2.addWeighted(self.source, 1 - t, self.target, t, 0)
+
+
+class MotionSlideshow:
+    def __init__(self, image_paths: Sequence[str], frame_duration: float, fps: int = 24,
+                 size: Optional[Tuple[int, int]] = None, scale: float = 1.0,
+                 transition: Optional[str] = "morph", transition_duration: float = 1.0,
+                 ken_burns: bool = False, zoom: float = 1.15, workers: Optional[int] = None,
+                 background=(0, 0, 0)):
+        """
+        Slideshow with transitions between images and optional Ken Burns motion.
+
+        Transitions take the last `transition_duration` of each image, so
+        the length of the slideshow is the same as with hard cuts. "morph"
+        estimates optical flow between the two images once and warps both
+        along it, "crossfade" only blends. Frames that move are rendered
+        with OpenCV (which releases the GIL) on a thread pool, a window of
+        frames ahead of the encoder; images are decoded as in ImageSequence.
+
+        Args:
+            image_paths: Image files, in order
+            frame_duration: Time each image is shown in seconds, transition included
+            fps: Frames per second of the output
+            size: Output (width, height), rounded to even numbers; defaults to
+                the size of the first image times `scale`
+            scale: Scale applied to the default size (see preview.scaled_size)
+            transition: "morph", "crossfade" or None for hard cuts
+            transition_duration: Length of each transition in seconds
+            ken_burns: Slowly zoom and pan over each image
+            zoom: Largest magnification of the Ken Burns motion
+            workers: Number of render threads (defaults to the CPU count)
+            background: Letterbox color
+        """
+        if transition is not None and transition not in TRANSITIONS:
+            raise ValueError(f"Unknown transition: {transition!r} "
+                             f"(expected one of {', '.join(TRANSITIONS)} or None)")
+        if size is None:
+            with ImageSequence(image_paths[:1], frame_duration, fps, scale=scale) as first:
+                size = first.size
+        self.size = even_size(*size)
+        self.fps = fps
+        self.transition = transition
+        self.ken_burns = ken_burns
+        self.zoom = zoom
+        # Ken Burns samples the images at the closest zoom, so they are decoded larger
+        source_size = scaled_size(*self.size, zoom) if ken_burns else self.size
+        self.sequence = ImageSequence(image_paths, frame_duration, fps, size=source_size,
+                                      background=background)
+        frames = self.sequence.frames_per_image
+        self.transition_frames = 0
+        if transition is not None and len(self.sequence) > 1:
+            self.transition_frames = max(0, min(int(round(transition_duration * fps)), frames - 1))
+
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="motion")
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._morphs: Dict[int, Future] = {}
+        self._images: Dict[int, np.ndarray] = {}
+        self._matrices: Dict[int, np.ndarray] = {}
+        # Every frame that moves, in order, as (kind, image, step)
+        self._plan: List[Tuple[str, int, int]] = []
+
+    def __len__(self):
+        return len(self.sequence)
+
+    @property
+    def duration(self) -> float:
+        return self.sequence.duration
+
+    def _still_frames(self, index: int) -> int:
+        """Frames of image index outside transitions; the last image has no transition out."""
+        if index == len(self) - 1:
+            return self.sequence.frames_per_image
+        return self.sequence.frames_per_image - self.transition_frames
+
+    def _image(self, index: int) -> np.ndarray:
+        """Decoded image at index; images must be requested in order."""
+        if index not in self._images:
+            self._images[index] = self.sequence.frame(index)
+            for stale in [i for i in self._images if i < index - 1]:
+                del self._images[stale]
+                self._matrices.pop(stale, None)
+        return self._images[index]
+
+    def _motion(self, index: int) -> np.ndarray:
+        """Ken Burns matrices of image index."""
+        matrices = self._matrices.get(index)
+        if matrices is None:
+            # Alternate zooming in and out, and drift toward a different corner each time
+            pan = ((-0.5, -0.5), (0.5, 0.5), (0.5, -0.5), (-0.5, 0.5))[index % 4]
+            matrices = ken_burns_matrices(*self.size, self._still_frames(index), self.zoom,
+                                          zoom_in=index % 2 == 0, pan=pan)
+            self._matrices[index] = matrices
+        return matrices
+
+    def _warp(self, image: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        return cv2.warpAffine(image, matrix, self.size, flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+    def _transition(self, index: int) -> Future:
+        """Queue the transition from image index to the next one, once."""
+        future = self._morphs.get(index)
+        if future is None:
+            source, target = self._image(index), self._image(index + 1)
+            if self.ken_burns:
+                # Morph between the last view of one image and the first view of the next
+                source_matrix, target_matrix = self._motion(index)[-1], self._motion(index + 1)[0]
+            make = _Crossfade if self.transition == "crossfade" else _Morph
+
+            def build():
+                if self.ken_burns:
+                    return make(self._warp(source, source_matrix), self._warp(target, target_matrix))
+                return make(source, target)
+
+            future = self._morphs[index] = self._pool.submit(build)
+            for stale in [i for i in self._morphs if i < index]:
+                del self._morphs[stale]
+        return future
+
+    def _submit(self, position: int) -> Future:
+        """Queue a moving frame for rendering. Called in plan order, so images are read in order."""
+        kind, index, step = self._plan[position]
+        if kind == "transition":
+            transition = self._transition(index)
+            t = (step + 1) / (self.transition_frames + 1)
+            # The transition was queued first, so it is running before this waits on it
+            return self._pool.submit(lambda: transition.result().frame(t))
+        return self._pool.submit(self._warp, self._image(index), self._motion(index)[step])
+
+    def _frame(self, position: int) -> np.ndarray:
+        """Rendered moving frame, queueing the next ones."""
+        with self._lock:
+            for stale in [i for i in self._pending if i < position]:
+                self._pending.pop(stale).cancel()
+            for i in range(position, min(position + 2 * self.workers + 1, len(self._plan))):
+                if i not in self._pending:
+                    self._pending[i] = self._submit(i)
+            future = self._pending.pop(position)
+        return future.result()
+
+    def _still(self, index: int) -> np.ndarray:
+        with self._lock:
+            return self._image(index)
+
+    def spans(self) -> List[FrameSpan]:
+        """Spans of the whole slideshow, for write_spans; frames are made as the encoder reaches them."""
+        spans = []
+        self._plan = []
+
+        def moving(kind, index, step):
+            spans.append(FrameSpan(lambda p=len(self._plan): self._frame(p), 1))
+            self._plan.append((kind, index, step))
+
+        for index in range(len(self)):
+            if self.ken_burns:
+                for step in range(self._still_frames(index)):
+                    moving("ken_burns", index, step)
+            else:
+                spans.append(FrameSpan(lambda i=index: self._still(i), self._still_frames(index)))
+            if index < len(self) - 1:
+                for step in range(self.transition_frames):
+                    moving("transition", index, step)
+        return spans
+
+    def clip(self):
+        """MoviePy clip of the whole slideshow, rendered as playback reaches each frame."""
+        spans = self.spans()
+        ends = np.cumsum([span.count for span in spans])
+
+        def make_frame(t):
+            # The epsilon keeps t = k / fps from rounding down to frame k - 1
+            n = min(int(t * self.fps + 1e-6), int(ends[-1]) - 1)
+            return spans[int(np.searchsorted(ends, n, side="right"))].frame()
+
+        return moviepy.VideoClip(make_frame, duration=self.duration)
+
+    def close(self):
+        """Stop rendering and drop every decoded image and frame."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._morphs.clear()
+            self._images.clear()
+        self._pool.shutdown(wait=True)
+        self.sequence.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
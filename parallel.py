@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        """
+        Space out calls so at most `rate` start per second, across threads.
+
+        Args:
+            rate: Maximum number of calls per second
+        """
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def call_with_timeout(func: Callable, arg, timeout: Optional[float]):
+    """
+    Call func(arg), raising TimeoutError if it does not finish in time.
+
+    The call runs on a daemon thread; a timed-out call is abandoned, not killed.
+    """
+    if timeout is None:
+        return func(arg)
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func(arg)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"Call did not finish within {timeout} seconds")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def imap_ordered(func: Callable, items: Iterable, max_workers: int = 4,
+                 timeout: Optional[float] = None, retries: int = 0, backoff: float = 1.0,
+                 rate_limit: Optional[float] = None) -> Iterator:
+    """
+    Like map_ordered, but yield each result as soon as it and all earlier ones are done.
+
+    Closing the generator early cancels the calls that have not started.
+    """
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    def attempt(item):
+        for n in range(retries + 1):
+            if limiter is not None:
+                limiter.wait()
+            try:
+                return call_with_timeout(func, item, timeout)
+            except Exception:
+                if n == retries:
+                    raise
+                time.sleep(backoff * (2 ** n))
+
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield attempt(item)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    try:
+        futures = [pool.submit(attempt, item) for item in items]
+        for future in futures:
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def map_ordered(func: Callable, items: Iterable, max_workers: int = 4,
+                timeout: Optional[float] = None, retries: int = 0, backoff: float = 1.0,
+                rate_limit: Optional[float] = None) -> List:
+    """
+    Apply func to every item on a thread pool, returning results in input order.
+
+    Args:
+        func: Function of one argument
+        items: Inputs
+        max_workers: Maximum number of concurrent calls
+        timeout: Per-call timeout in seconds
+        retries: Number of retries after a failed or timed-out call
+        backoff: Delay before the first retry; doubles on each further retry
+        rate_limit: Maximum number of calls started per second
+
+    Returns:
+        List of results, in the same order as items
+
+    Raises:
+        The last error of the first item (in input order) that still fails
+        after all retries; pending items are cancelled.
+    """
+    return list(imap_ordered(func, items, max_workers, timeout, retries, backoff, rate_limit))
@@ -0,0 +1,67 @@
+import copy
+import os
+from typing import Optional, Tuple
+
+from encoder import EncodeOptions
+
+# Defaults of generator.preview()
+PREVIEW_SCALE = 0.25
+PREVIEW_FPS = 12
+
+
+def scaled_size(width: int, height: int, scale: float = 1.0) -> Tuple[int, int]:
+    """
+    Frame size of a render at `scale`.
+
+    Dimensions are rounded to even numbers, which yuv420p encoders require.
+    """
+    if scale == 1.0:
+        return width, height
+    return max(2, 2 * round(width * scale / 2)), max(2, 2 * round(height * scale / 2))
+
+
+def even_size(width: int, height: int) -> Tuple[int, int]:
+    """Round a frame size to even dimensions, which yuv420p encoders require."""
+    return max(2, 2 * round(width / 2)), max(2, 2 * round(height / 2))
+
+
+def preview_options() -> EncodeOptions:
+    """Codec parameters for previews: the fastest x264 preset at a lower quality."""
+    return EncodeOptions(preset="ultrafast", crf=30)
+
+
+def preview_of(generator, scale: float = PREVIEW_SCALE, fps: int = PREVIEW_FPS,
+               output_dir: Optional[str] = None):
+    """
+    Copy a generator so that it renders quick low-resolution previews.
+
+    The copy lays slides out at the generator's full resolution and draws
+    them scaled down, so text sits where it will in the final render. It
+    encodes at `fps` with preview_options(). It takes the fastest
+    encoding path and shares the caches and TTS layer of the original.
+
+    Args:
+        generator: Any of the generators (they all have scale, fps and
+            encode_options attributes)
+        scale: Fraction of the full resolution to render at
+        fps: Frames per second of the preview
+        output_dir: Output directory of the copy (defaults to a "preview"
+            subdirectory of the generator's output_dir, if it has one)
+
+    Returns:
+        The configured copy
+    """
+    if not 0 < scale <= 1:
+        raise ValueError(f"scale must be in (0, 1], got {scale}")
+    preview = copy.copy(generator)
+    preview.scale = scale
+    preview.fps = fps
+    preview.encode_options = preview_options()
+    if hasattr(preview, "fast_still"):
+        preview.fast_still = True
+    if output_dir is None and getattr(generator, "output_dir", None) is not None:
+        output_dir = os.path.join(generator.output_dir, "preview")
+    if output_dir is not None:
+        preview.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+    return preview
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from diskcache import DiskStore, cache_root
+from encoder import EncodeOptions, ffmpeg_exe, still_spans, write_spans
+from metrics import count, registry
+from transitions import frame_digest
+
+# Bump when the way segments are encoded changes, to invalidate cached segments
+SEGMENT_VERSION = 1
+
+
+class StillSegment:
+    def __init__(self, frame: np.ndarray, duration: float, fade_in: float = 0.0,
+                 fade_out: float = 0.0, previous: Optional[np.ndarray] = None):
+        """
+        One slide of a segmented render: a still with optional fades.
+
+        Only the still itself is sent to the worker; the fade frames are
+        computed there, so a segment pickles to the size of one or two frames.
+
+        Args:
+            frame: HxWx3 uint8 still
+            duration: Duration in seconds
+            fade_in: Fade-in duration in seconds
+            fade_out: Fade-out duration in seconds (to black)
+            previous: Crossfade in from this frame instead of fading in from black
+        """
+        self.frame = frame
+        self.duration = duration
+        self.fade_in = fade_in
+        self.fade_out = fade_out
+        self.previous = previous
+
+    def frame_count(self, fps: int) -> int:
+        return int(round(self.duration * fps))
+
+    def spans(self, fps: int):
+        return still_spans(self.frame, self.duration, fps, self.fade_in, self.fade_out, self.previous)
+
+    def key(self, fps: int, options: EncodeOptions) -> str:
+        """Hash of everything that determines the encoded segment."""
+        payload = json.dumps([
+            SEGMENT_VERSION, frame_digest(self.frame),
+            None if self.previous is None else frame_digest(self.previous),
+            self.frame_count(fps), fps, self.fade_in, self.fade_out,
+            options.codec, options.preset, options.crf, options.pix_fmt,
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class SegmentCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 4 << 30):
+        """
+        Encoded segments on disk, keyed by the hash of their inputs.
+
+        A re-render of an edited slide list only encodes the segments whose
+        inputs changed and joins them with the cached ones, which is a
+        packet copy.
+
+        Args:
+            cache_dir: Directory for the segments (defaults to <cache root>/segments)
+            max_bytes: Maximum total size of the cached segments
+        """
+        self.store = DiskStore(cache_dir or os.path.join(cache_root(), "segments"), max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, key: str, path: str) -> bool:
+        """
+        Place the cached segment for key at path.
+
+        The entry is hard-linked (or copied), so evicting it while a render
+        still needs it is harmless.
+
+        Returns:
+            Whether the segment was cached
+        """
+        cached = self.store.get_path(key, ".mp4")
+        if cached is not None:
+            try:
+                _link_or_copy(cached, path)
+            except OSError:
+                cached = None
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached is not None
+
+    def put(self, key: str, path: str):
+        """Store a copy of an encoded segment under key."""
+        os.makedirs(self.store.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.store.directory, suffix=".tmp")
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            _link_or_copy(path, tmp_path)
+            self.store.put_file(key, tmp_path, ".mp4")
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"Error writing segment cache: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """Drop every cached segment and reset the counters."""
+        with self._lock:
+            self.hits = self.misses = 0
+        self.store.clear()
+
+
+_default_segment_cache = None
+
+
+def default_segment_cache() -> SegmentCache:
+    """Process-wide segment cache."""
+    global _default_segment_cache
+    if _default_segment_cache is None:
+        _default_segment_cache = SegmentCache()
+        registry.register_cache("segments", _default_segment_cache.stats)
+    return _default_segment_cache
+
+
+def encode_segment(segment: StillSegment, output_path: str, fps: int,
+                   options: Optional[EncodeOptions] = None) -> str:
+    """Encode one segment on its own, without audio."""
+    return write_spans(segment.spans(fps), output_path, fps, options=options)
+
+
+def concat_segments(paths: Sequence[str], output_path: str, duration: float,
+                    audio_path: Optional[str] = None, options: Optional[EncodeOptions] = None) -> str:
+    """
+    Join segments encoded with the same codec parameters without re-encoding.
+
+    The video streams are copied through ffmpeg's concat demuxer and the
+    audio file, if any, is encoded and muxed in the same pass.
+
+    Args:
+        paths: Segment files, in order
+        output_path: Path of the video to write
+        duration: Total duration in seconds; the audio is trimmed to it
+        audio_path: Optional audio file to mux in
+        options: Codec parameters the segments were encoded with
+
+    Returns:
+        output_path
+    """
+    options = options or EncodeOptions()
+    list_fd, list_path = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(list_fd, "w", encoding="utf-8") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        cmd = [ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            cmd += ["-t", f"{duration:.3f}", "-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        cmd += ["-c:v", "copy"]
+        if audio_path:
+            cmd += options.audio_args()
+        cmd.append(output_path)
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def render_segments(segments: Sequence[StillSegment], output_path: str, fps: int,
+                    audio_path: Optional[str] = None, options: Optional[EncodeOptions] = None,
+                    workers: Optional[int] = None, cache: Optional[SegmentCache] = None) -> str:
+    """
+    Encode every segment in its own process, then join them losslessly.
+
+    All segments are encoded with the same options, so the concat step
+    only copies packets; the render scales with the number of cores
+    instead of being bound by one ffmpeg process and one frame producer.
+    With a cache, only segments whose inputs changed since an earlier
+    render are encoded, and identical segments are encoded once.
+
+    Args:
+        segments: Segments in playback order; all frames must share one size
+        output_path: Path of the video to write
+        fps: Frames per second
+        audio_path: Optional audio file to mux in, trimmed to the video length
+        options: Codec parameters for every segment
+        workers: Number of encoder processes (defaults to the CPU count)
+        cache: Optional segment cache to reuse and store encoded segments
+
+    Returns:
+        output_path
+    """
+    options = options or EncodeOptions()
+    segments = [segment for segment in segments if segment.frame_count(fps) > 0]
+    if not segments:
+        raise ValueError("No frames to encode")
+    duration = sum(segment.frame_count(fps) for segment in segments) / fps
+
+    with tempfile.TemporaryDirectory(prefix="segments-") as directory:
+        paths: List[str] = [os.path.join(directory, f"{i:05d}.mp4") for i in range(len(segments))]
+        # Segments to encode, by key; later segments with the same key are linked to the first
+        todo: Dict[str, int] = {}
+        duplicates = []
+        for i, segment in enumerate(segments):
+            key = segment.key(fps, options) if cache is not None else str(i)
+            if key in todo:
+                duplicates.append((todo[key], i))
+            elif cache is None or not cache.fetch(key, paths[i]):
+                todo[key] = i
+
+        workers = min(workers or os.cpu_count() or 1, max(1, len(todo)))
+        if workers <= 1:
+            for i in todo.values():
+                encode_segment(segments[i], paths[i], fps, options)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(encode_segment, segments[i], paths[i], fps, options)
+                           for i in todo.values()]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            # Worker processes count into their own registries
+            count("frames_encoded", sum(segments[i].frame_count(fps) for i in todo.values()))
+
+        if cache is not None:
+            for key, i in todo.items():
+                cache.put(key, paths[i])
+        for first, i in duplicates:
+            _link_or_copy(paths[first], paths[i])
+        return concat_segments(paths, output_path, duration, audio_path, options)
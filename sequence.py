@@ -0,0 +1,121 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from encoder import FrameSpan, fit_to_frame
+from lazy import lazy_import
+from preview import even_size, scaled_size
+
+moviepy = lazy_import("moviepy.editor")
+
+
+class ImageSequence:
+    def __init__(self, image_paths: Sequence[str], frame_duration: float, fps: int = 24,
+                 size: Optional[Tuple[int, int]] = None, scale: float = 1.0, prefetch: int = 4,
+                 background=(0, 0, 0)):
+        """
+        Slideshow source that decodes each image only when it is about to be shown.
+
+        Images are decoded and letterboxed to the output size in one pass
+        (JPEGs are decoded directly at a reduced size when much larger than
+        the output). The next `prefetch` images are decoded on a background
+        thread. Only those and the image on screen are held in memory, so
+        peak memory does not depend on the length of the sequence.
+
+        Args:
+            image_paths: Image files, in order
+            frame_duration: Time each image is shown in seconds
+            fps: Frames per second of the output
+            size: Output (width, height), rounded to even numbers; defaults to
+                the size of the first image times `scale`
+            scale: Scale applied to the default size (see preview.scaled_size)
+            prefetch: Number of images decoded ahead of the one on screen
+            background: Letterbox color
+        """
+        self.image_paths = list(image_paths)
+        if not self.image_paths:
+            raise ValueError("No images")
+        self.frame_duration = frame_duration
+        self.fps = fps
+        if size is None:
+            with Image.open(self.image_paths[0]) as first:  # Reads the header only
+                size = scaled_size(*first.size, scale)
+        self.size = even_size(*size)
+        self.prefetch = prefetch
+        self.background = background
+        self._pending: Dict[int, Future] = {}
+        self._current: Tuple[int, Optional[np.ndarray]] = (-1, None)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-prefetch")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    @property
+    def frames_per_image(self) -> int:
+        return int(round(self.frame_duration * self.fps))
+
+    @property
+    def duration(self) -> float:
+        return len(self) * self.frames_per_image / self.fps
+
+    def load(self, index: int) -> np.ndarray:
+        """Decode and letterbox one image, without prefetching or caching."""
+        width, height = self.size
+        with Image.open(self.image_paths[index]) as image:
+            image.draft("RGB", (width, height))
+            return fit_to_frame(image, width, height, self.background)
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        The letterboxed image at index, queueing the next ones for decoding.
+
+        Images before index are dropped, so read the sequence in order;
+        going back decodes the image again.
+        """
+        with self._lock:
+            current, frame = self._current
+            if index == current:
+                return frame
+            for stale in [i for i in self._pending if i < index]:
+                self._pending.pop(stale).cancel()
+            for i in range(index, min(index + self.prefetch + 1, len(self))):
+                if i not in self._pending:
+                    self._pending[i] = self._pool.submit(self.load, i)
+            future = self._pending.pop(index)
+        frame = future.result()
+        with self._lock:
+            self._current = (index, frame)
+        return frame
+
+    def spans(self) -> List[FrameSpan]:
+        """One span per image, for write_spans; pixels are loaded when the encoder reaches them."""
+        return [FrameSpan(lambda i=i: self.frame(i), self.frames_per_image) for i in range(len(self))]
+
+    def clip(self):
+        """MoviePy clip of the whole sequence that decodes images as playback reaches them."""
+        last = len(self) - 1
+
+        def make_frame(t):
+            # The epsilon keeps t = k / fps from rounding down to frame k - 1
+            return self.frame(min(int(t * self.fps + 1e-6) // max(1, self.frames_per_image), last))
+
+        return moviepy.VideoClip(make_frame, duration=self.duration)
+
+    def close(self):
+        """Stop prefetching and drop every decoded image."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._current = (-1, None)
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
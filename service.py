@@ -0,0 +1,473 @@
+"""
+Render video jobs over HTTP on a warm process pool.
+
+A long-running local service for the generators that batch.py runs from
+files. Jobs use the same spec as batch.py:
+
+    curl -s -X POST localhost:8750/jobs -d '{"id": "intro", "generator": "multi-text",
+        "params": {"text_list": ["Welcome", "Thank you for watching"]}}'
+
+Endpoints:
+
+    POST   /jobs              queue a job: 202 with its status, 429 when the queue is full
+    GET    /jobs              status of every known job
+    GET    /jobs/<id>         status of one job
+    GET    /jobs/<id>/events  progress as JSON lines, streamed until the job finishes
+    GET    /jobs/<id>/result  the rendered video, once the job succeeded
+    DELETE /jobs/<id>         cancel a queued job
+    GET    /health            queue depth and worker count
+
+Usage:
+
+    python service.py --port 8750 --workers 4 --queue-size 32
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from batch import GENERATORS, run_job
+from metrics import watch_stages
+
+# Largest accepted request body
+MAX_BODY = 1 << 20
+
+# Font sizes whose glyphs are rasterized when a worker starts
+WARM_FONT_SIZES = (60,)
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+               429: "Too Many Requests", 500: "Internal Server Error"}
+
+_events = None  # Worker side of the progress queue
+
+# Internal event a worker sends after the last stage event of a job
+DRAINED = "_drained"
+
+# Longest wait for a job's remaining stage events once its result is in
+DRAIN_TIMEOUT = 5.0
+
+
+def _warm_worker(events):
+    """
+    Process pool initializer: import and load everything a render needs once.
+
+    Generator modules, MoviePy, the ffmpeg binary and the glyphs of the
+    default font are loaded here, so a job does not pay for them.
+    """
+    global _events
+    _events = events
+    # Ctrl-C reaches the whole process group; the service shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module_name in sorted({module for module, _, _ in GENERATORS.values()}):
+        importlib.import_module(module_name)
+    try:
+        importlib.import_module("moviepy.editor")
+    except ImportError:
+        pass
+    from encoder import ffmpeg_exe
+    from textlayout import get_atlas
+    ffmpeg_exe()
+    for size in WARM_FONT_SIZES:
+        atlas = get_atlas(size)
+        atlas.width("".join(chr(c) for c in range(32, 127)))
+
+
+def _run_job(job_id: str, spec: dict) -> Dict:
+    """Run one job in a worker, sending stage events back to the service."""
+
+    def report(event, stage, seconds):
+        _events.put((job_id, {"event": f"stage_{event}", "stage": stage,
+                              "seconds": round(seconds, 4), "time": time.time()}))
+
+    watch_stages(report)
+    try:
+        return run_job(spec)
+    finally:
+        watch_stages(None)
+        # Sent last, so the service knows every stage event of the job has arrived
+        _events.put((job_id, {"event": DRAINED}))
+
+
+class Job:
+    def __init__(self, job_id: str, spec: dict):
+        """State of one job as the service sees it."""
+        self.id = job_id
+        self.spec = spec
+        self.status = "queued"  # queued, running, ok, failed or cancelled
+        self.stage: Optional[str] = None
+        self.result: Optional[Dict] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.events: List[Dict] = []
+        self.changed = asyncio.Event()
+        self.drained = asyncio.Event()  # Set when the worker's last stage event arrived
+        self.add_event({"event": "queued", "time": self.created})
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("ok", "failed", "cancelled")
+
+    def add_event(self, event: Dict):
+        """Record an event and wake everything streaming this job."""
+        if event["event"] == "stage_start":
+            self.stage = event["stage"]
+        self.events.append(event)
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self) -> Dict:
+        record = {"id": self.id, "generator": self.spec.get("generator"), "status": self.status,
+                  "stage": self.stage, "created": self.created, "started": self.started,
+                  "finished": self.finished}
+        if self.result is not None:
+            record.update({key: value for key, value in self.result.items()
+                           if key not in ("id", "generator", "status", "traceback")})
+        return record
+
+
+class RenderService:
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 32, history: int = 1000):
+        """
+        Job queue in front of a pool of warm worker processes.
+
+        At most `queue_size` jobs wait; submissions beyond that are refused
+        (HTTP 429) rather than queued without bound. Each worker process
+        imports the generators and loads fonts and ffmpeg once, then
+        renders jobs with batch.run_job. Stage timings from the metrics
+        spans come back as progress events while a job runs.
+
+        Args:
+            workers: Number of worker processes (defaults to the CPU count)
+            queue_size: Maximum number of jobs waiting for a worker
+            history: Number of finished jobs kept for status and result requests
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.history = history
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._waiting = 0  # Queued jobs that were not cancelled
+        self._events = multiprocessing.Queue()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pump: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                   initargs=(self._events,))
+
+    async def start(self):
+        """Start the worker processes and the dispatchers."""
+        self._loop = asyncio.get_running_loop()
+        # Unbounded: the bound is on live jobs, so cancelled ones still in the queue do not count
+        self._queue = asyncio.Queue()
+        self._pool = self._new_pool()
+        # Start every worker now, so the first jobs do not wait for the warm-up
+        await asyncio.gather(*[self._loop.run_in_executor(self._pool, time.sleep, 0)
+                               for _ in range(self.workers)])
+        self._pump = threading.Thread(target=self._pump_events, name="job-events", daemon=True)
+        self._pump.start()
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the dispatchers and shut the workers down."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._events.put(None)
+        self._pump.join()
+
+    def _pump_events(self):
+        """Forward stage events from the workers to the event loop."""
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_event, *item)
+
+    def _on_event(self, job_id: str, event: Dict):
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return
+        if event["event"] == DRAINED:
+            job.drained.set()
+        else:
+            job.add_event(event)
+
+    def submit(self, spec: dict) -> Tuple[int, Dict]:
+        """
+        Queue a job.
+
+        Returns:
+            (HTTP status, body): 202 and the job status, or an error with
+            400 (invalid spec), 409 (id in use) or 429 (queue full)
+        """
+        if not isinstance(spec, dict):
+            return 400, {"error": "job spec must be a JSON object"}
+        if spec.get("generator") not in GENERATORS:
+            return 400, {"error": f"Unknown generator: {spec.get('generator')!r} "
+                                  f"(expected one of {', '.join(GENERATORS)})"}
+        job_id = str(spec.get("id") or uuid.uuid4().hex)
+        existing = self.jobs.get(job_id)
+        if existing is not None and not existing.done:
+            return 409, {"error": f"Job {job_id!r} is already {existing.status}"}
+        if self._waiting >= self.queue_size:
+            return 429, {"error": "Job queue is full", "queued": self._waiting,
+                         "retry_after": self.retry_after()}
+        spec = dict(spec, id=job_id)
+        job = Job(job_id, spec)
+        self.jobs.pop(job_id, None)
+        self.jobs[job_id] = job
+        self._queue.put_nowait(job)
+        self._waiting += 1
+        self._forget_old_jobs()
+        return 202, job.to_dict()
+
+    def cancel(self, job_id: str) -> Tuple[int, Dict]:
+        """Cancel a job that has not started."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return 404, {"error": f"No job {job_id!r}"}
+        if job.status != "queued":
+            return 409, {"error": f"Job {job_id!r} is already {job.status}"}
+        job.status, job.finished = "cancelled", time.time()
+        self._waiting -= 1
+        job.add_event({"event": "cancelled", "time": job.finished})
+        return 200, job.to_dict()
+
+    def retry_after(self) -> int:
+        """Seconds a refused client should wait, from the mean time of recent jobs."""
+        recent = [job.finished - job.started for job in reversed(self.jobs.values())
+                  if job.finished and job.started][:20]
+        mean = sum(recent) / len(recent) if recent else 5.0
+        return max(1, int(round(mean * max(1, self._waiting) / self.workers)))
+
+    def health(self) -> Dict:
+        statuses = [job.status for job in self.jobs.values()]
+        return {"workers": self.workers, "queue_size": self.queue_size,
+                "queued": self._waiting, "running": statuses.count("running"),
+                "jobs": len(statuses)}
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _dispatch(self):
+        """Feed queued jobs to the pool, one at a time per dispatcher."""
+        while True:
+            job = await self._queue.get()
+            if job.status == "cancelled":
+                continue
+            self._waiting -= 1
+            job.status, job.started = "running", time.time()
+            job.add_event({"event": "started", "time": job.started})
+            result = await self._render(job)
+            job.result = result
+            job.status = result["status"]
+            job.finished = time.time()
+            job.add_event({"event": "finished", "status": job.status, "output": result.get("output"),
+                           "error": result.get("error"), "time": job.finished})
+            self._forget_old_jobs()
+
+    async def _render(self, job: Job) -> Dict:
+        """
+        Run a job on the pool.
+
+        A crashed worker breaks the whole pool, so the pool is replaced and
+        the job retried once before it is failed (as batch.py does).
+        """
+        for attempt in range(2):
+            pool = self._pool
+            try:
+                result = await self._loop.run_in_executor(pool, _run_job, job.id, job.spec)
+            except BrokenProcessPool:
+                job.drained.clear()
+                if self._pool is pool:
+                    pool.shutdown(wait=False)
+                    self._pool = self._new_pool()
+                continue
+            # Stage events travel separately from the result; wait for the last ones
+            try:
+                await asyncio.wait_for(job.drained.wait(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            return result
+        return {"status": "failed", "output": None, "error": "worker process died"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    """Parse one HTTP/1.1 request into (method, path, body)."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(400, f"Malformed request line: {request_line!r}")
+    length = 0
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            try:
+                length = int(value.strip())
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise HttpError(400, f"Invalid Content-Length: {value.strip()!r}")
+    if length > MAX_BODY:
+        raise HttpError(413, f"Request body larger than {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), unquote(target.split("?", 1)[0]), body
+
+
+def _head(status: int, content_type: str, length: Optional[int] = None,
+          extra: Optional[Dict[str, str]] = None) -> bytes:
+    headers = {"Content-Type": content_type, "Connection": "close"}
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    headers.update(extra or {})
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, body, extra=None):
+    data = json.dumps(body).encode("utf-8")
+    writer.write(_head(status, "application/json", len(data), extra) + data)
+    await writer.drain()
+
+
+async def _stream_events(writer: asyncio.StreamWriter, job: Job):
+    """Send a job's events as JSON lines until it finishes; the closed connection ends the body."""
+    writer.write(_head(200, "application/x-ndjson"))
+    sent = 0
+    while True:
+        changed = job.changed
+        for event in job.events[sent:]:
+            writer.write(json.dumps(event).encode("utf-8") + b"\n")
+        sent = len(job.events)
+        await writer.drain()
+        if job.done:
+            return
+        await changed.wait()
+
+
+async def _send_file(writer: asyncio.StreamWriter, path: str):
+    writer.write(_head(200, "video/mp4", os.path.getsize(path)))
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(1 << 20)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+
+
+async def handle(service: RenderService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve one request."""
+    try:
+        method, path, body = await _read_request(reader)
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            await _send_json(writer, 200, service.health())
+        elif parts == ["jobs"] and method == "GET":
+            await _send_json(writer, 200, [job.to_dict() for job in service.jobs.values()])
+        elif parts == ["jobs"] and method == "POST":
+            try:
+                spec = json.loads(body or b"null")
+            except ValueError as e:
+                raise HttpError(400, f"Invalid JSON: {e}")
+            status, record = service.submit(spec)
+            extra = {"Retry-After": str(record["retry_after"])} if status == 429 else None
+            await _send_json(writer, status, record, extra)
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = service.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, f"No job {parts[1]!r}")
+            action = parts[2] if len(parts) == 3 else None
+            if action is None and method == "GET":
+                await _send_json(writer, 200, job.to_dict())
+            elif action is None and method == "DELETE":
+                await _send_json(writer, *service.cancel(job.id))
+            elif action == "events" and method == "GET":
+                await _stream_events(writer, job)
+            elif action == "result" and method == "GET":
+                if job.status != "ok":
+                    raise HttpError(409 if not job.done else 404, f"Job {job.id!r} is {job.status}")
+                output = job.result.get("output")
+                if not output or not os.path.isfile(output):
+                    raise HttpError(404, f"Output of job {job.id!r} is missing")
+                await _send_file(writer, output)
+            else:
+                raise HttpError(405 if action in (None, "events", "result") else 404,
+                                f"{method} {path} is not supported")
+        else:
+            raise HttpError(404, f"{method} {path} is not supported")
+    except HttpError as e:
+        await _send_json(writer, e.status, {"error": str(e)})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        await _send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8750, workers: Optional[int] = None,
+                queue_size: int = 32, history: int = 1000):
+    """Run the service until cancelled."""
+    service = RenderService(workers, queue_size, history)
+    await service.start()
+    server = await asyncio.start_server(lambda r, w: handle(service, r, w), host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving on http://{address[0]}:{address[1]} with {service.workers} workers "
+          f"(queue size {queue_size})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render video jobs over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8750, help="port to listen on (default: 8750)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="jobs that may wait for a worker before new ones are refused (default: 32)")
+    parser.add_argument("--history", type=int, default=1000,
+                        help="finished jobs kept for status and result requests (default: 1000)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size, args.history))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
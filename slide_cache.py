@@ -0,0 +1,155 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from diskcache import DiskStore, cache_root
+from metrics import registry
+
+
+class SlideCache:
+    def __init__(self, max_memory_bytes: int = 256 << 20, cache_dir: Optional[str] = None,
+                 max_disk_bytes: int = 2 << 30, use_disk: bool = True):
+        """
+        Content-addressed cache of rendered slide frames.
+
+        Frames live in a size-bounded in-memory LRU, backed by an on-disk
+        store of .npy files that survives across runs.
+
+        Args:
+            max_memory_bytes: Maximum total size of frames kept in memory
+            cache_dir: Directory for the disk store (defaults to <cache root>/slides)
+            max_disk_bytes: Maximum total size of the disk store
+            use_disk: Whether to use the disk store at all
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.disk = None
+        if use_disk:
+            self.disk = DiskStore(cache_dir or os.path.join(cache_root(), "slides"), max_disk_bytes)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(**params) -> str:
+        """
+        Hash the inputs that determine a slide's pixels.
+
+        Args:
+            params: JSON-serializable render inputs, e.g. text, font, font_size,
+                background and resolution
+
+        Returns:
+            Hex digest identifying the slide
+        """
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, frame: np.ndarray):
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+            if frame.nbytes > self.max_memory_bytes:
+                return
+            self._frames[key] = frame
+            self._memory_bytes += frame.nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                _, old = self._frames.popitem(last=False)
+                self._memory_bytes -= old.nbytes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up a frame in memory, then on disk.
+
+        Returns:
+            Read-only frame array, or None if the slide is not cached
+        """
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.memory_hits += 1
+                return frame
+        if self.disk is not None:
+            data = self.disk.get(key, ".npy")
+            if data is not None:
+                try:
+                    frame = np.load(io.BytesIO(data), allow_pickle=False)
+                except ValueError:
+                    frame = None
+                if frame is not None:
+                    frame.setflags(write=False)
+                    self._remember(key, frame)
+                    with self._lock:
+                        self.disk_hits += 1
+                    return frame
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, frame: np.ndarray) -> np.ndarray:
+        """
+        Store a frame in memory and on disk.
+
+        Returns:
+            The read-only frame as stored in the cache
+        """
+        frame = np.ascontiguousarray(frame)
+        frame.setflags(write=False)
+        self._remember(key, frame)
+        if self.disk is not None:
+            buffer = io.BytesIO()
+            np.save(buffer, frame, allow_pickle=False)
+            try:
+                self.disk.put(key, buffer.getvalue(), ".npy")
+            except OSError as e:
+                print(f"Error writing slide cache: {str(e)}")
+        return frame
+
+    def get_or_render(self, key: str, render: Callable[[], np.ndarray]) -> np.ndarray:
+        """Return the cached frame for key, rendering and storing it on a miss."""
+        frame = self.get(key)
+        if frame is None:
+            frame = self.put(key, render())
+        return frame
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._frames),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def clear(self, disk: bool = False):
+        """Drop all in-memory frames and counters, and optionally the disk store."""
+        with self._lock:
+            self._frames.clear()
+            self._memory_bytes = 0
+            self.memory_hits = self.disk_hits = self.misses = 0
+        if disk and self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache = None
+
+
+def default_cache() -> SlideCache:
+    """Process-wide slide cache shared by all generators."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SlideCache()
+        registry.register_cache("slides", _default_cache.stats)
+    return _default_cache
@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+from PIL import ImageColor
+
+from fonts import DEFAULT_FONT
+from preview import scaled_size
+from slide_cache import SlideCache, default_cache
+from textlayout import block_height, draw_lines, fit_text, get_atlas
+
+# Bump when the rendering below changes, so stale cached slides are not reused
+RENDER_VERSION = 2
+
+
+def pick_background(choices, text, seed=None):
+    """
+    Pick a background for a slide.
+
+    Without a seed this is random.choice; with a seed the choice depends only
+    on (seed, text), so a repeated slide gets the same background and can be
+    served from the slide cache.
+    """
+    if seed is None:
+        return random.choice(choices)
+    return random.Random(f"{seed}:{text}").choice(choices)
+
+
+def _rgb(color):
+    return ImageColor.getrgb(color) if isinstance(color, str) else tuple(color)
+
+
+def render_text_frame(text, width, height, background, font_size=60, text_color=(0, 0, 0),
+                      font_family=DEFAULT_FONT, cache: SlideCache = None, scale: float = 1.0,
+                      margin: float = 0.05, min_font_size: int = 12,
+                      line_spacing: float = 1.15) -> np.ndarray:
+    """
+    Render centered text on a solid background.
+
+    The text is wrapped to the frame width minus the margins. If the lines
+    do not fit, the font shrinks step by step down to min_font_size. Lines
+    are composed from cached glyph masks (see textlayout).
+
+    With a scale below 1 the layout is still computed at width x height
+    and drawn scaled down, so a preview wraps and places text where the
+    full render does.
+
+    Args:
+        text: Slide text; newlines force line breaks
+        width: Frame width in pixels
+        height: Frame height in pixels
+        background: Background color (RGB tuple or PIL color name)
+        font_size: Largest font size in pixels
+        text_color: Text color (RGB tuple or PIL color name)
+        font_family: Font file name or path
+        cache: Slide cache to use (defaults to the process-wide cache)
+        scale: Fraction of width x height to render at (see preview.scaled_size)
+        margin: Margin on each side as a fraction of the frame size
+        min_font_size: Smallest font size auto-fit may shrink to
+        line_spacing: Distance between lines as a multiple of the line height
+
+    Returns:
+        Read-only HxWx3 uint8 frame of the scaled size
+    """
+    background = _rgb(background)
+    text_color = _rgb(text_color)
+    cache = cache if cache is not None else default_cache()
+    key = SlideCache.key(
+        version=RENDER_VERSION, text=text, font=font_family, font_size=font_size,
+        background=background, text_color=text_color, resolution=(width, height), scale=scale,
+        margin=margin, min_font_size=min_font_size, line_spacing=line_spacing,
+    )
+
+    def render():
+        # Lay out at full size
+        size, lines = fit_text(text, width * (1 - 2 * margin), height * (1 - 2 * margin),
+                               font_size, font_family, min_font_size, line_spacing)
+        atlas = get_atlas(size, font_family)
+        pitch = atlas.line_height * line_spacing
+        top = (height - block_height(len(lines), atlas, line_spacing)) / 2
+
+        out_width, out_height = scaled_size(width, height, scale)
+        if (out_width, out_height) != (width, height):
+            # Draw the same lines scaled down at the same relative positions
+            factor = out_height / height
+            atlas = get_atlas(max(1, round(size * factor)), font_family)
+            top, pitch = top * factor, pitch * factor
+
+        # Filling one row and copying it down is much faster than broadcasting a color tuple
+        row = np.empty((1, out_width, 3), dtype=np.uint8)
+        row[:] = background
+        frame = np.empty((out_height, out_width, 3), dtype=np.uint8)
+        frame[:] = row
+        return draw_lines(frame, lines, atlas, text_color, top, pitch)
+
+    return cache.get_or_render(key, render)
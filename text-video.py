@@ -1,78 +1,77 @@
-from PIL import Image, ImageDraw, ImageFont
-import cv2
+from PIL import Image
 import numpy as np
-from gtts import gTTS
-import os
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, CompositeVideoClip
-import random
+from lazy import lazy_import
+from slides import pick_background, render_text_frame
+from tts import default_tts
+from encoder import still_spans, write_clip, write_spans
+from metrics import begin_render, span
+from preview import PREVIEW_FPS, PREVIEW_SCALE, preview_of
+
+moviepy = lazy_import("moviepy.editor")
+
 class SimpleVideoGenerator:
-    def __init__(self):
+    def __init__(self, seed=None, slide_cache=None, tts=None, fast_still=True):
         self.width = 1280
         self.height = 720
         self.duration = 5  # video duration in seconds
         self.fps = 24
+        self.scale = 1.0  # Fraction of width x height actually rendered (see preview)
+        self.encode_options = None  # Codec parameters (None = encoder defaults)
+        self.seed = seed  # Makes background choices repeatable, so slides hit the cache
+        self.slide_cache = slide_cache
+        self.tts = tts or default_tts()
+        self.fast_still = fast_still  # Encode the still slide as one span instead of per-frame clips
         
     def create_text_image(self, text):
         """Create an image with text"""
-        # Create a blank image with white background
+        # Pick a background color and render the text in the center of the image
         color = ["yellow","pink","white"]
-        mychoice = random.choice(color)
-        image = Image.new('RGB', (self.width, self.height), mychoice)
-        draw = ImageDraw.Draw(image)
-        
-        # Try to use Arial font, fall back to default if not available
-        try:
-            font = ImageFont.truetype("arial.ttf", 60)
-        except:
-            font = ImageFont.load_default()
-        
-        # Draw text in the center of image
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        x = (self.width - text_width) // 2
-        y = (self.height - text_height) // 2
-        
-        draw.text((x, y), text, fill='black', font=font)
-        return image
+        mychoice = pick_background(color, text, self.seed)
+        frame = render_text_frame(text, self.width, self.height, mychoice, 60, 'black',
+                                  cache=self.slide_cache, scale=self.scale)
+        return Image.fromarray(frame)
+    
+    def preview(self, scale=PREVIEW_SCALE, fps=PREVIEW_FPS):
+        """Return a copy of this generator that renders quick low-resolution previews"""
+        return preview_of(self, scale, fps)
     
     def create_video(self, text, output_path="output.mp4"):
+        render = begin_render("text_video.video")
         try:
             # Create image with text
-            image = self.create_text_image(text)
-            
-            # Save image temporarily
-            temp_image_path = "temp_frame.png"
-            image.save(temp_image_path)
-            
-            # Create audio file
-            temp_audio_path = "temp_audio.mp3"
-            tts = gTTS(text=text, lang='en')
-            tts.save(temp_audio_path)
-            
-            # Create video from image
-            image_clip = ImageClip(temp_image_path).set_duration(self.duration)
+            with span("text_render"):
+                image = self.create_text_image(text)
             
-            # Load audio and set duration
-            audio_clip = AudioFileClip(temp_audio_path)
+            # Get speech audio (served from the TTS cache on repeats)
+            with span("tts"):
+                audio_path = self.tts.synthesize(text, lang='en')
             
-            # Combine image and audio
-            video = image_clip.set_audio(audio_clip)
+            if self.fast_still:
+                # The frame never changes: pipe one buffer to ffmpeg for the whole duration
+                with span("encode"):
+                    spans = still_spans(np.array(image), self.duration, self.fps)
+                    write_spans(spans, output_path, self.fps, audio_path=audio_path,
+                                options=self.encode_options)
+                print(f"Video created successfully at: {output_path}")
+                return render.succeed(output_path)
             
-            # Write the final video
-            video.write_videofile(output_path, fps=self.fps)
+            # Create video from the in-memory image
+            with span("clip_build"):
+                image_clip = moviepy.ImageClip(np.array(image)).set_duration(self.duration)
             
-            # Clean up temporary files
-            os.remove(temp_image_path)
-            os.remove(temp_audio_path)
+            # Write the final video, muxing the cached speech in directly
+            with span("encode"):
+                write_clip(image_clip, output_path, self.fps, audio_path=audio_path,
+                           options=self.encode_options)
+            with span("cleanup"):
+                image_clip.close()
             
             print(f"Video created successfully at: {output_path}")
-            return True
+            return render.succeed(output_path)
             
         except Exception as e:
             print(f"Error creating video: {str(e)}")
-            return False
+            return render.fail(e)
 
 # Example usage
 if __name__ == "__main__":
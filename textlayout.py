@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from fonts import DEFAULT_FONT, get_font
+
+
+class GlyphAtlas:
+    def __init__(self, font):
+        """
+        Rasterized glyphs of one font at one size.
+
+        Each character is rendered through FreeType once, as an alpha mask
+        with its offset and advance, and kerning is measured once per pair.
+        Lines are then composed by copying masks, so laying out and drawing
+        text that was seen before costs no FreeType calls.
+
+        Args:
+            font: PIL font (from fonts.get_font)
+        """
+        self.font = font
+        try:
+            self.ascent, self.descent = font.getmetrics()
+        except AttributeError:
+            # Bitmap fonts have no metrics: measure tall and deep glyphs
+            bbox = font.getbbox("Ag")
+            self.ascent, self.descent = bbox[3], 0
+        self.line_height = self.ascent + self.descent
+        self._glyphs: Dict[str, Tuple[Optional[np.ndarray], int, int, float]] = {}
+        self._kerning: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, char: str) -> Tuple[Optional[np.ndarray], int, int, float]:
+        """
+        Look up (or rasterize) a character.
+
+        Returns:
+            (alpha mask or None for blank glyphs, x offset, y offset from the
+            top of the line, advance)
+        """
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            left, top, right, bottom = self.font.getbbox(char)
+            mask = None
+            if right > left and bottom > top:
+                image = Image.new("L", (right - left, bottom - top), 0)
+                ImageDraw.Draw(image).text((-left, -top), char, fill=255, font=self.font)
+                mask = np.asarray(image)
+                if not mask.any():
+                    mask = None
+            glyph = (mask, left, top, self.font.getlength(char))
+            with self._lock:
+                self._glyphs[char] = glyph
+        return glyph
+
+    def kerning(self, first: str, second: str) -> float:
+        """Adjustment of the advance between two characters."""
+        pair = first + second
+        adjust = self._kerning.get(pair)
+        if adjust is None:
+            adjust = self.font.getlength(pair) - self.glyph(first)[3] - self.glyph(second)[3]
+            with self._lock:
+                self._kerning[pair] = adjust
+        return adjust
+
+    def positions(self, text: str) -> Tuple[List[float], float]:
+        """Pen position of every character and the advance width of the whole text."""
+        positions, pen, previous = [], 0.0, None
+        for char in text:
+            if previous is not None:
+                pen += self.kerning(previous, char)
+            positions.append(pen)
+            pen += self.glyph(char)[3]
+            previous = char
+        return positions, pen
+
+    def width(self, text: str) -> float:
+        return self.positions(text)[1]
+
+    def blit(self, alpha: np.ndarray, text: str, x: float, y: int,
+             index: Optional[np.ndarray] = None, first: int = 0):
+        """
+        Draw a line into an alpha buffer (HxW uint8) with its top-left corner at (x, y).
+
+        If an index buffer (HxW integers) is given, each pixel a glyph
+        covers is set to the position of its character in the text plus
+        `first`, so effects can reveal text character by character.
+        """
+        positions, _ = self.positions(text)
+        height, width = alpha.shape
+        for k, (char, pen) in enumerate(zip(text, positions)):
+            mask, left, top, _ = self.glyph(char)
+            if mask is None:
+                continue
+            x0, y0 = int(round(x + pen)) + left, y + top
+            x1, y1 = x0 + mask.shape[1], y0 + mask.shape[0]
+            # Clip to the buffer
+            cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+            if cx0 >= cx1 or cy0 >= cy1:
+                continue
+            target = alpha[cy0:cy1, cx0:cx1]
+            source = mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+            np.maximum(target, source, out=target)
+            if index is not None:
+                index[cy0:cy1, cx0:cx1][source > 0] = first + k
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"glyphs": len(self._glyphs), "kerning_pairs": len(self._kerning)}
+
+
+_atlases: "OrderedDict[Tuple[str, int], GlyphAtlas]" = OrderedDict()
+_atlases_lock = threading.Lock()
+MAX_ATLASES = 64
+
+
+def get_atlas(size: int, family: str = DEFAULT_FONT) -> GlyphAtlas:
+    """Process-wide glyph atlas for a (family, size), least recently used ones dropped first."""
+    key = (family, size)
+    with _atlases_lock:
+        atlas = _atlases.get(key)
+        if atlas is not None:
+            _atlases.move_to_end(key)
+            return atlas
+    atlas = GlyphAtlas(get_font(size, family))
+    with _atlases_lock:
+        atlas = _atlases.setdefault(key, atlas)
+        while len(_atlases) > MAX_ATLASES:
+            _atlases.popitem(last=False)
+    return atlas
+
+
+def wrap_text(text: str, atlas: GlyphAtlas, max_width: float) -> List[str]:
+    """
+    Break text into lines no wider than max_width.
+
+    Lines break at spaces and at explicit newlines; a word wider than a
+    line on its own is broken between characters.
+    """
+    space = atlas.glyph(" ")[3]
+    lines = []
+    for paragraph in text.split("\n"):
+        line, line_width = "", 0.0
+        for word in paragraph.split():
+            word_width = atlas.width(word)
+            if line:
+                # Measured incrementally: the line, a space and the word, with kerning at the joins
+                width = (line_width + atlas.kerning(line[-1], " ") + space
+                         + atlas.kerning(" ", word[0]) + word_width)
+                if width <= max_width:
+                    line, line_width = f"{line} {word}", width
+                    continue
+                lines.append(line)
+            if word_width <= max_width:
+                line, line_width = word, word_width
+                continue
+            line, line_width = "", 0.0
+            for char in word:
+                advance = atlas.glyph(char)[3]
+                width = line_width + (atlas.kerning(line[-1], char) if line else 0.0) + advance
+                if line and width > max_width:
+                    lines.append(line)
+                    line, width = "", advance
+                line, line_width = line + char, width
+        lines.append(line)
+    return lines
+
+
+def fit_text(text: str, max_width: float, max_height: float, font_size: int = 60,
+             family: str = DEFAULT_FONT, min_size: int = 12, line_spacing: float = 1.15
+             ) -> Tuple[int, List[str]]:
+    """
+    Choose the largest font size, at most font_size, at which the wrapped text fits.
+
+    The size shrinks by about 10% per step and stops at min_size, where
+    text that still does not fit is left to overflow.
+
+    Returns:
+        (font size, lines)
+    """
+    size = font_size
+    while True:
+        atlas = get_atlas(size, family)
+        lines = wrap_text(text, atlas, max_width)
+        height = block_height(len(lines), atlas, line_spacing)
+        if size <= min_size or (height <= max_height
+                                and all(atlas.width(line) <= max_width for line in lines)):
+            return size, lines
+        size = max(min_size, min(size - 1, int(size * 0.9)))
+
+
+def block_height(lines: int, atlas: GlyphAtlas, line_spacing: float = 1.15) -> int:
+    """Height of a block of lines: full line height for the last, spaced pitch for the others."""
+    if lines == 0:
+        return 0
+    return int(round((lines - 1) * atlas.line_height * line_spacing)) + atlas.line_height
+
+
+def draw_lines(frame: np.ndarray, lines: List[str], atlas: GlyphAtlas, color,
+               top: float, line_pitch: float, center_x: Optional[float] = None) -> np.ndarray:
+    """
+    Draw lines of text centered horizontally onto a frame, in place.
+
+    The lines are blitted into one alpha mask and the frame is blended
+    with the text color once.
+
+    Args:
+        frame: HxWx3 uint8 frame
+        lines: Lines of text
+        atlas: Glyph atlas of the font
+        color: RGB text color
+        top: Top of the first line
+        line_pitch: Distance between the tops of consecutive lines
+        center_x: Horizontal center of the lines (defaults to the frame center)
+
+    Returns:
+        frame
+    """
+    height, width = frame.shape[:2]
+    center_x = width / 2 if center_x is None else center_x
+    if not lines:
+        return frame
+    # Only the block of text is blitted and blended, with room for overhanging glyphs
+    widths = [atlas.width(line) for line in lines]
+    pad = atlas.line_height
+    x0 = max(0, int(center_x - max(widths) / 2) - pad)
+    x1 = min(width, int(center_x + max(widths) / 2) + pad)
+    y0 = max(0, int(top) - pad)
+    y1 = min(height, int(top + (len(lines) - 1) * line_pitch) + atlas.line_height + pad)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    alpha = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    for i, (line, line_width) in enumerate(zip(lines, widths)):
+        atlas.blit(alpha, line, center_x - line_width / 2 - x0, int(round(top + i * line_pitch)) - y0)
+    # Blend only the covered pixels; most of the block is background
+    covered = alpha > 0
+    a = alpha[covered][:, None].astype(np.uint16)
+    region = frame[y0:y1, x0:x1]
+    pixels = region[covered].astype(np.uint16)
+    ink = np.array(color, dtype=np.uint16)
+    region[covered] = ((pixels * (255 - a) + ink * a + 127) // 255).astype(np.uint8)
+    return frame
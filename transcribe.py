@@ -0,0 +1,160 @@
+import os
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from audio import decode_audio, to_int16
+from parallel import imap_ordered
+
+# Sample rate audio is decoded at for recognition
+RECOGNITION_RATE = 16000
+
+
+class TranscriptSegment(NamedTuple):
+    start: float  # seconds
+    end: float  # seconds
+    text: str
+
+
+class Recognizer:
+    """Base class for speech recognition backends."""
+    name = "base"
+
+    def recognize(self, samples: np.ndarray, sample_rate: int, lang: str = 'en-US') -> str:
+        """
+        Recognize speech in one chunk.
+
+        Args:
+            samples: Mono float32 samples
+            sample_rate: Sample rate of the samples
+            lang: Language code
+
+        Returns:
+            Recognized text, or "" if nothing was understood
+        """
+        raise NotImplementedError
+
+
+class GoogleRecognizer(Recognizer):
+    """Google Web Speech API through SpeechRecognition."""
+    name = "google"
+
+    def recognize(self, samples, sample_rate, lang='en-US'):
+        import speech_recognition as sr
+
+        audio = sr.AudioData(to_int16(samples).tobytes(), sample_rate, 2)
+        try:
+            return sr.Recognizer().recognize_google(audio, language=lang)
+        except sr.UnknownValueError:
+            return ""
+
+
+class LocalRecognizer(Recognizer):
+    """
+    Offline stand-in that needs no network access.
+
+    Returns a deterministic placeholder describing the chunk, so the
+    chunking and ordering can be exercised without a recognition service.
+    """
+    name = "local"
+
+    def recognize(self, samples, sample_rate, lang='en-US'):
+        return f"<speech {len(samples) / sample_rate:.2f}s>"
+
+
+RECOGNIZERS = {
+    GoogleRecognizer.name: GoogleRecognizer,
+    LocalRecognizer.name: LocalRecognizer,
+}
+
+
+def speech_chunks(samples: np.ndarray, sample_rate: int, threshold_db: float = -40.0,
+                  min_silence: float = 0.3, max_chunk: float = 30.0, padding: float = 0.1,
+                  block: float = 0.02) -> List[Tuple[int, int]]:
+    """
+    Split audio into silence-bounded chunks of speech with an energy detector.
+
+    Args:
+        samples: Mono float32 samples
+        sample_rate: Sample rate of the samples
+        threshold_db: Block RMS level counted as speech
+        min_silence: Shortest pause that ends a chunk, in seconds
+        max_chunk: Longest chunk in seconds; longer speech is cut at the
+            quietest block
+        padding: Silence kept around each chunk, in seconds
+        block: Length of a level measurement block in seconds
+
+    Returns:
+        (start, end) sample ranges, in order
+    """
+    size = max(1, int(block * sample_rate))
+    blocks = len(samples) // size
+    if blocks == 0:
+        return []
+    rms = np.sqrt(np.mean(samples[:blocks * size].reshape(blocks, size) ** 2, axis=1))
+    voiced = np.flatnonzero(rms > 10 ** (threshold_db / 20))
+    if len(voiced) == 0:
+        return []
+
+    # Runs of voiced blocks, merged across pauses shorter than min_silence
+    gaps = np.flatnonzero(np.diff(voiced) > max(1, int(min_silence / block)))
+    starts = np.concatenate([[voiced[0]], voiced[gaps + 1]])
+    ends = np.concatenate([voiced[gaps], [voiced[-1]]]) + 1
+
+    longest = max(1, int(max_chunk / block))
+    pad = int(padding / block)
+    chunks = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        # Padding goes on the pauses only, so cut chunks do not overlap
+        start, end = max(0, start - pad), min(blocks, end + pad)
+        while end - start > longest:
+            # Cut at the quietest block in the second half of the window
+            window = rms[start + longest // 2:start + longest]
+            cut = start + longest // 2 + int(np.argmin(window)) + 1
+            chunks.append((start * size, cut * size))
+            start = cut
+        chunks.append((start * size, end * size))
+    return chunks
+
+
+def transcribe_stream(path: str, recognizer: Optional[Recognizer] = None, lang: str = 'en-US',
+                      max_workers: int = 4, timeout: Optional[float] = 60.0, retries: int = 2,
+                      backoff: float = 1.0, **chunk_options) -> Iterator[TranscriptSegment]:
+    """
+    Transcribe the audio of a file chunk by chunk.
+
+    Chunks are recognized concurrently and yielded in order as soon as they
+    and every earlier chunk are done, so a long file takes about as long
+    as its slowest chunk rather than one request for the whole file.
+
+    Args:
+        path: Audio or video file
+        recognizer: Recognition backend (defaults to the one named by
+            VIDEOGEN_RECOGNIZER, or Google)
+        lang: Language code
+        max_workers: Maximum number of concurrent recognition requests
+        timeout: Per-request timeout in seconds
+        retries: Number of retries for a failed or timed-out request
+        backoff: Delay before the first retry in seconds, doubled on each retry
+        **chunk_options: Passed to speech_chunks
+
+    Yields:
+        TranscriptSegment per chunk with recognized text
+    """
+    if recognizer is None:
+        recognizer = RECOGNIZERS[os.environ.get("VIDEOGEN_RECOGNIZER", GoogleRecognizer.name)]()
+    samples = decode_audio(path, RECOGNITION_RATE, channels=1)[:, 0]
+    chunks = speech_chunks(samples, RECOGNITION_RATE, **chunk_options)
+
+    def recognize(chunk):
+        start, end = chunk
+        return recognizer.recognize(samples[start:end], RECOGNITION_RATE, lang)
+
+    texts = imap_ordered(recognize, chunks, max_workers=max_workers, timeout=timeout,
+                         retries=retries, backoff=backoff)
+    try:
+        for (start, end), text in zip(chunks, texts):
+            if text:
+                yield TranscriptSegment(start / RECOGNITION_RATE, end / RECOGNITION_RATE, text)
+    finally:
+        texts.close()
@@ -0,0 +1,200 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from metrics import registry
+
+# Frames blended per numpy pass when crossfading, to bound temporary memory
+BLEND_BATCH = 8
+
+
+def fade_factors(duration: float, fps: int, fade_in: float = 0.0, fade_out: float = 0.0) -> np.ndarray:
+    """
+    Brightness factor of every frame of a clip, as MoviePy's fadein/fadeout compute it.
+
+    Returns:
+        Array of round(duration * fps) factors in [0, 1]
+    """
+    total = int(round(duration * fps))
+    t = np.arange(total) / fps
+    factors = np.ones(total)
+    if fade_in > 0:
+        factors = np.minimum(factors, np.clip(t / fade_in, 0, 1))
+    if fade_out > 0:
+        factors = np.minimum(factors, np.clip((duration - t) / fade_out, 0, 1))
+    return factors
+
+
+def fade_from_black(frame: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """
+    Scale a frame by each factor in one pass through a uint8 lookup table.
+
+    The table holds int(v * factor) for every value v, which is exactly what
+    MoviePy's float multiply and uint8 conversion produce.
+
+    Args:
+        frame: HxWx3 uint8 frame
+        factors: N brightness factors
+
+    Returns:
+        NxHxWx3 uint8 frames
+    """
+    table = (np.arange(256)[None, :] * np.asarray(factors, dtype=np.float64)[:, None]).astype(np.uint8)
+    return np.take(table, frame, axis=1)
+
+
+def crossfade(source: np.ndarray, target: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """
+    Blend from source to target with integer alpha blending.
+
+    Args:
+        source: HxWx3 uint8 frame shown at factor 0
+        target: HxWx3 uint8 frame shown at factor 1
+        factors: N blend factors
+
+    Returns:
+        NxHxWx3 uint8 frames
+    """
+    weights = np.round(np.asarray(factors) * 256).astype(np.uint16)
+    source = source.astype(np.uint16)
+    delta = target.astype(np.int16) - source.astype(np.int16)
+    out = np.empty((len(weights),) + target.shape, dtype=np.uint8)
+    # source + (target - source) * w / 256, batched to bound the int32 temporary
+    for start in range(0, len(weights), BLEND_BATCH):
+        w = weights[start:start + BLEND_BATCH].astype(np.int32)[:, None, None, None]
+        out[start:start + BLEND_BATCH] = (source[None] + ((delta[None] * w) >> 8)).astype(np.uint8)
+    return out
+
+
+def frame_digest(frame: np.ndarray) -> str:
+    """Content hash of a frame."""
+    digest = hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16)
+    digest.update(repr(frame.shape).encode())
+    return digest.hexdigest()
+
+
+class TransitionEngine:
+    def __init__(self, max_cached_bytes: int = 256 << 20):
+        """
+        Precompute fade and crossfade frames, reusing them across identical slides.
+
+        Args:
+            max_cached_bytes: Maximum total size of cached transition frames
+        """
+        self.max_cached_bytes = max_cached_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _cached(self, key, compute):
+        with self._lock:
+            frames = self._cache.get(key)
+            if frames is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return frames
+            self.misses += 1
+        frames = compute()
+        frames.setflags(write=False)
+        with self._lock:
+            if frames.nbytes <= self.max_cached_bytes and key not in self._cache:
+                self._cache[key] = frames
+                self._cached_bytes += frames.nbytes
+                while self._cached_bytes > self.max_cached_bytes:
+                    _, old = self._cache.popitem(last=False)
+                    self._cached_bytes -= old.nbytes
+        return frames
+
+    def fade_frames(self, frame: np.ndarray, factors: np.ndarray,
+                    source: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Frames of a fade, from black (or from source, for a crossfade) to frame.
+
+        Args:
+            frame: HxWx3 uint8 frame at full brightness
+            factors: N fade factors, 1.0 meaning frame itself
+            source: Frame to crossfade from instead of black
+
+        Returns:
+            Read-only NxHxWx3 uint8 frames
+        """
+        factors = np.asarray(factors, dtype=np.float64)
+        key = (frame_digest(frame), None if source is None else frame_digest(source),
+               factors.tobytes())
+        if source is None:
+            return self._cached(key, lambda: fade_from_black(frame, factors))
+        return self._cached(key, lambda: crossfade(source, frame, factors))
+
+    def stats(self):
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached_bytes": self._cached_bytes}
+
+
+_default_engine = None
+
+
+def default_engine() -> TransitionEngine:
+    """Process-wide transition engine."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = TransitionEngine()
+        registry.register_cache("transitions", _default_engine.stats)
+    return _default_engine
+
+
+def faded_frames(frame: np.ndarray, duration: float, fps: int, fade_in: float = 0.0,
+                 fade_out: float = 0.0, previous: Optional[np.ndarray] = None,
+                 engine: Optional[TransitionEngine] = None):
+    """
+    Precompute every distinct frame of a still clip with fades.
+
+    Args:
+        frame: HxWx3 uint8 still
+        duration: Clip duration in seconds
+        fps: Frames per second
+        fade_in: Fade-in duration in seconds
+        fade_out: Fade-out duration in seconds (to black)
+        previous: Crossfade in from this frame instead of fading in from black
+        engine: Transition engine (defaults to the process-wide one)
+
+    Returns:
+        (factors, frames): the per-frame factors and an array with one frame
+        per factor below 1.0, in order; frames with factor 1.0 are `frame`
+    """
+    engine = engine or default_engine()
+    factors = fade_factors(duration, fps, fade_in, fade_out)
+    if previous is not None and fade_in > 0:
+        # The fade-in window blends from the previous slide; fade-out still goes to black
+        window = int(round(fade_in * fps))
+        head, tail = factors[:window], factors[window:]
+        head = engine.fade_frames(frame, head[head < 1], source=previous)
+        tail = engine.fade_frames(frame, tail[tail < 1])
+        return factors, np.concatenate([head, tail])
+    return factors, engine.fade_frames(frame, factors[factors < 1])
+
+
+def faded_clip(frame: np.ndarray, duration: float, fps: int, fade_in: float = 0.0,
+               fade_out: float = 0.0, previous: Optional[np.ndarray] = None):
+    """
+    MoviePy clip of a still with precomputed fades, replacing clip.fadeout().fadein().
+
+    Rendering a frame is an array lookup instead of a float multiply per pixel.
+    """
+    from moviepy.editor import VideoClip
+
+    factors, frames = faded_frames(frame, duration, fps, fade_in, fade_out, previous)
+    # Map each frame index to its precomputed frame, or -1 for the still itself
+    lookup = np.full(len(factors), -1)
+    lookup[factors < 1] = np.arange(len(frames))
+
+    def make_frame(t):
+        i = min(max(int(round(t * fps)), 0), len(lookup) - 1)
+        return frame if lookup[i] < 0 else frames[lookup[i]]
+
+    return VideoClip(make_frame, duration=duration)
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import wave
+from typing import Dict, Optional
+
+import numpy as np
+
+from diskcache import DiskStore, cache_root
+from metrics import registry
+
+
+class TTSBackend:
+    """Base class for speech synthesis backends."""
+    name = "base"
+    extension = ".mp3"
+
+    def synthesize(self, text: str, lang: str = 'en', voice: Optional[str] = None) -> bytes:
+        """
+        Synthesize speech.
+
+        Args:
+            text: Text to speak
+            lang: Language code
+            voice: Backend-specific voice name
+
+        Returns:
+            Encoded audio in the backend's format
+        """
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech; voice selects the accent via the gTTS tld."""
+    name = "gtts"
+    extension = ".mp3"
+
+    def synthesize(self, text, lang='en', voice=None):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, tld=voice or "com").write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class ToneBackend(TTSBackend):
+    """
+    Offline stand-in that needs no network access.
+
+    Produces a WAV whose length follows the number of words and whose pitch
+    is derived from the text, so output is deterministic per (text, lang, voice).
+    """
+    name = "tone"
+    extension = ".wav"
+
+    def __init__(self, sample_rate: int = 22050, seconds_per_word: float = 0.35,
+                 silent: bool = False):
+        self.sample_rate = sample_rate
+        self.seconds_per_word = seconds_per_word
+        self.silent = silent
+
+    def synthesize(self, text, lang='en', voice=None):
+        duration = max(0.5, self.seconds_per_word * len(text.split()))
+        samples = np.zeros(int(duration * self.sample_rate), dtype=np.int16)
+        if not self.silent:
+            digest = hashlib.sha256(f"{text}|{lang}|{voice}".encode("utf-8")).digest()
+            frequency = 200 + digest[0] * 2
+            t = np.arange(len(samples)) / self.sample_rate
+            samples = (np.sin(2 * np.pi * frequency * t) * 8000).astype(np.int16)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+
+BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    ToneBackend.name: ToneBackend,
+}
+
+
+class TextToSpeech:
+    def __init__(self, backend: TTSBackend = None, cache_dir: Optional[str] = None,
+                 max_cache_bytes: int = 512 << 20):
+        """
+        Speech synthesis with a persistent audio cache.
+
+        Args:
+            backend: Synthesis backend (defaults to the one named by
+                VIDEOGEN_TTS_BACKEND, or gTTS)
+            cache_dir: Directory for cached audio (defaults to <cache root>/tts)
+            max_cache_bytes: Maximum total size of the audio cache
+        """
+        if backend is None:
+            backend = BACKENDS[os.environ.get("VIDEOGEN_TTS_BACKEND", GTTSBackend.name)]()
+        self.backend = backend
+        self.cache = DiskStore(cache_dir or os.path.join(cache_root(), "tts"), max_cache_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, text: str, lang: str = 'en', voice: Optional[str] = None) -> str:
+        """Hash of (backend, text, lang, voice) identifying a cached synthesis."""
+        payload = json.dumps([self.backend.name, text, lang, voice])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def synthesize(self, text: str, lang: str = 'en', voice: Optional[str] = None) -> str:
+        """
+        Get speech audio for text, synthesizing it only on a cache miss.
+
+        Args:
+            text: Text to speak
+            lang: Language code
+            voice: Backend-specific voice name
+
+        Returns:
+            Path to a checked-out copy of the cached audio file, which
+            cache eviction does not remove (see DiskStore.checkout)
+        """
+        key = self.key(text, lang, voice)
+        path = self.cache.checkout(key, self.backend.extension)
+        with self._lock:
+            if path is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if path is None:
+            path = self.cache.put(key, self.backend.synthesize(text, lang, voice),
+                                  self.backend.extension, checkout=True)
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_default_tts = None
+
+
+def default_tts() -> TextToSpeech:
+    """Process-wide TTS layer shared by all generators."""
+    global _default_tts
+    if _default_tts is None:
+        _default_tts = TextToSpeech()
+        registry.register_cache("tts", _default_tts.stats)
+    return _default_tts
@@ -0,0 +1,292 @@
+"""
+Render jobs from a shared SQLite job queue, on as many hosts as can reach it.
+
+Jobs use the same spec as batch.py. Submit them once, then start workers
+anywhere the queue file and the artifact directory are mounted:
+
+    python worker.py submit queue.db jobs.jsonl
+    python worker.py work queue.db --processes 4 --artifacts /shared/videogen-cache
+    python worker.py status queue.db --jobs
+
+Workers lease one job at a time and renew the lease while rendering. When
+a worker dies, its job is retried by another one after the lease expires.
+Every worker uses the artifact directory as its cache root
+(VIDEOGEN_CACHE_DIR). Slides, TTS audio, mixed audio and encoded segments
+are content-addressed there, so work one node did is reused by all. Each
+finished video is also published there under the hash of its contents.
+"""
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from batch import GENERATORS, read_jobs, run_job, validate_job
+from diskcache import DiskStore, cache_root
+from jobqueue import JobQueue
+
+# Size bound of the published outputs in the artifact directory
+MAX_OUTPUT_BYTES = 16 << 30
+
+# A worker process that crashes is restarted after RESTART_DELAY seconds,
+# doubling on each crash in a row, and given up after MAX_RESTARTS crashes
+# in a row. A process that ran for RESTART_WINDOW seconds starts the count over.
+RESTART_DELAY = 1.0
+MAX_RESTARTS = 5
+RESTART_WINDOW = 60.0
+
+
+def publish_output(path: str, store: DiskStore) -> Dict:
+    """
+    Copy a rendered file into a store under the SHA-256 of its contents.
+
+    Returns:
+        Artifact record with key, path and bytes
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    key, suffix = digest.hexdigest(), os.path.splitext(path)[1]
+    stored = store.get_path(key, suffix)
+    if stored is None:
+        # Copy next to the entry (same filesystem), then move it in atomically
+        tmp_path = f"{store.path_for(key, suffix)}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        shutil.copyfile(path, tmp_path)
+        stored = store.put_file(key, tmp_path, suffix)
+    return {"key": key, "path": stored, "bytes": os.path.getsize(stored)}
+
+
+def _share_caches(spec: dict) -> dict:
+    """Turn on the segment cache for generators that have one, so encoded slides are shared."""
+    if spec.get("generator") not in GENERATORS:
+        return spec
+    module_name, class_name, _ = GENERATORS[spec["generator"]]
+    generator_class = getattr(importlib.import_module(module_name), class_name)
+    if "incremental" in inspect.signature(generator_class).parameters:
+        spec = dict(spec, init=dict({"incremental": True}, **spec.get("init", {})))
+    return spec
+
+
+class _Heartbeat:
+    def __init__(self, queue: JobQueue, lease):
+        """Renew a lease every third of its length until stopped."""
+        self.lost = False
+        self._queue = queue
+        self._lease = lease
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._queue.lease_seconds / 3):
+            try:
+                if not self._queue.renew(self._lease):
+                    self.lost = True
+                    return
+            except Exception as e:
+                # A busy or briefly unreachable database: try again at the next beat
+                print(f"Could not renew lease of {self._lease.job_id}: {e}", flush=True)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def work(queue_path: str, artifacts: Optional[str] = None, lease_seconds: float = 300.0,
+         poll: float = 2.0, exit_when_idle: bool = False, name: Optional[str] = None) -> int:
+    """
+    Claim and render jobs until stopped.
+
+    Args:
+        queue_path: SQLite queue file
+        artifacts: Shared cache root (defaults to VIDEOGEN_CACHE_DIR or the user cache)
+        lease_seconds: Lease length; a job is retried this long after its worker dies
+        poll: Seconds to wait when no job is ready
+        exit_when_idle: Return once no job is queued or running
+        name: Worker name recorded with its jobs (defaults to host:pid)
+
+    Returns:
+        Number of jobs this worker finished
+    """
+    if artifacts:
+        os.environ["VIDEOGEN_CACHE_DIR"] = artifacts
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(queue_path, lease_seconds=lease_seconds)
+    outputs = DiskStore(os.path.join(cache_root(), "outputs"), MAX_OUTPUT_BYTES)
+    finished = 0
+    while True:
+        lease = queue.claim(name)
+        if lease is None:
+            counts = queue.counts()
+            if exit_when_idle and counts["queued"] == 0 and counts["running"] == 0:
+                return finished
+            time.sleep(poll)
+            continue
+
+        error = validate_job(lease.spec)
+        if error is not None:
+            # An unknown generator or arguments that do not fit fail the same way on every attempt
+            result = {"id": lease.job_id, "generator": lease.spec.get("generator"), "status": "failed",
+                      "output": None, "error": error, "seconds": 0.0, "worker": name,
+                      "attempt": lease.attempt}
+            if queue.fail(lease, error, result, retry=False):
+                finished += 1
+                print(f"[failed] {lease.job_id} (invalid job, {name}) {error}", flush=True)
+            continue
+
+        heartbeat = _Heartbeat(queue, lease)
+        try:
+            result = run_job(_share_caches(lease.spec))
+            if result["status"] == "ok" and result["output"] and os.path.isfile(result["output"]):
+                result["artifact"] = publish_output(result["output"], outputs)
+        except (SystemExit, KeyboardInterrupt):
+            # Stopped (SIGTERM, Ctrl-C): hand the job back uncounted instead of waiting out the lease
+            heartbeat.stop()
+            queue.release(lease)
+            raise
+        except Exception as e:
+            result = {"id": lease.job_id, "generator": lease.spec.get("generator"), "status": "failed",
+                      "output": None, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+        heartbeat.stop()
+        result["worker"], result["attempt"] = name, lease.attempt
+        if result["status"] == "ok":
+            recorded = queue.complete(lease, result)
+        else:
+            recorded = queue.fail(lease, result["error"], result)
+        if heartbeat.lost or not recorded:
+            print(f"[lost] {lease.job_id}: lease expired while rendering; another worker has it",
+                  flush=True)
+            continue
+        finished += 1
+        detail = result.get("artifact", {}).get("path") if result["status"] == "ok" else result["error"]
+        print(f"[{result['status']}] {lease.job_id} (attempt {lease.attempt}, {name}, "
+              f"{result['seconds']:.2f}s) {detail}", flush=True)
+
+
+def _worker_process(*args):
+    # Turn SIGTERM into SystemExit so work() can hand its job back
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    work(*args)
+
+
+def run_workers(queue_path: str, processes: int, artifacts: Optional[str] = None,
+                lease_seconds: float = 300.0, poll: float = 2.0, exit_when_idle: bool = False):
+    """
+    Run several worker processes, restarting any that crash.
+
+    Restarts back off (see RESTART_DELAY), so a worker that cannot start
+    at all, e.g. because the queue file is unreachable, is given up on
+    instead of restarted in a loop. Ctrl-C stops the workers; their jobs
+    go back to the queue.
+    """
+    args = (queue_path, artifacts, lease_seconds, poll, exit_when_idle)
+    workers = {}
+    started = {}
+    crashes = {slot: 0 for slot in range(processes)}
+    restarts = {}  # slot -> time it is restarted at
+
+    def start(slot):
+        process = multiprocessing.Process(target=_worker_process, args=args, name=f"worker-{slot}")
+        process.start()
+        workers[slot] = process
+        started[slot] = time.monotonic()
+
+    for slot in range(processes):
+        start(slot)
+    try:
+        while workers or restarts:
+            for slot, at in list(restarts.items()):
+                if time.monotonic() >= at:
+                    del restarts[slot]
+                    start(slot)
+            if not workers:
+                time.sleep(0.5)
+            for slot, process in list(workers.items()):
+                process.join(timeout=0.5 / len(workers))
+                if process.exitcode is None:
+                    continue
+                del workers[slot]
+                if process.exitcode == 0:
+                    continue
+                if time.monotonic() - started[slot] >= RESTART_WINDOW:
+                    crashes[slot] = 0
+                crashes[slot] += 1
+                if crashes[slot] > MAX_RESTARTS:
+                    print(f"Worker {slot} exited with code {process.exitcode} "
+                          f"{crashes[slot]} times in a row; giving up on it", flush=True)
+                    continue
+                delay = RESTART_DELAY * 2 ** (crashes[slot] - 1)
+                print(f"Worker {slot} exited with code {process.exitcode}; "
+                      f"restarting in {delay:.0f}s", flush=True)
+                restarts[slot] = time.monotonic() + delay
+    except KeyboardInterrupt:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render video jobs from a shared job queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="add jobs from a JSONL file to the queue")
+    submit.add_argument("queue", help="SQLite queue file")
+    submit.add_argument("jobs", help="JSONL file with one job spec per line, or - for stdin")
+    submit.add_argument("--priority", type=int, default=0, help="higher priorities are claimed first")
+    submit.add_argument("--max-attempts", type=int, default=3,
+                        help="attempts before a job is failed for good (default: 3)")
+
+    worker = commands.add_parser("work", help="claim and render jobs")
+    worker.add_argument("queue", help="SQLite queue file")
+    worker.add_argument("--processes", type=int, default=1, help="worker processes on this host")
+    worker.add_argument("--artifacts", default=None,
+                        help="shared cache directory (default: VIDEOGEN_CACHE_DIR or ~/.cache)")
+    worker.add_argument("--lease", type=float, default=300.0,
+                        help="lease length in seconds; crashed jobs are retried after it (default: 300)")
+    worker.add_argument("--poll", type=float, default=2.0, help="seconds between polls when idle")
+    worker.add_argument("--exit-when-idle", action="store_true",
+                        help="exit once no job is queued or running")
+
+    status = commands.add_parser("status", help="show job counts")
+    status.add_argument("queue", help="SQLite queue file")
+    status.add_argument("--jobs", action="store_true", help="print one JSON line per job")
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        queue = JobQueue(args.queue, max_attempts=args.max_attempts)
+        specs = []
+        for number, spec, error in read_jobs(args.jobs):
+            if spec is None:
+                print(f"Skipping line {number}: invalid JSON: {error}")
+                continue
+            spec.setdefault("id", f"line {number}")
+            specs.append(spec)
+        ids = queue.submit_many(specs, args.priority)
+        print(f"Queued {len(ids)} jobs")
+    elif args.command == "work":
+        run_workers(args.queue, args.processes, args.artifacts, args.lease, args.poll,
+                    args.exit_when_idle)
+    else:
+        queue = JobQueue(args.queue)
+        if args.jobs:
+            for record in queue.jobs():
+                print(json.dumps(record))
+        counts = queue.counts()
+        print(", ".join(f"{count} {status}" for status, count in counts.items()))
+        sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()